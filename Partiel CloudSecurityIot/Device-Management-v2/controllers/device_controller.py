@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Security, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Security, Request, Response
 from typing import List, Optional
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from dto.device_dto import DeviceCreateDTO, DeviceUpdateDTO, DeviceResponseDTO
+from dto.device_dto import (
+    DeviceCreateDTO, DeviceUpdateDTO, DeviceResponseDTO, DeviceBulkCreateDTO, DeviceBulkCreateResponseDTO,
+    DeviceBulkStatusDTO, DeviceBulkStatusResponseDTO
+)
 from dal.device_dao import DeviceDAO
-from helpers.config import get_db, AUTH_SERVICE_URL
+from helpers.config import get_db, AUTH_SERVICE_URL, MQTT_DEVICE_EVENTS_TOPIC, DEVICE_COUNT_EXACT_THRESHOLD
 from helpers.utils import decode_token, publish_mqtt_message
+from helpers.heartbeat_buffer import heartbeat_buffer
 import requests
 from datetime import datetime
 import logging
@@ -16,6 +20,9 @@ http_bearer = HTTPBearer()
 # Logger setup
 logger = logging.getLogger("device_management")
 
+# Devices par message de l'événement groupé devices_created
+BULK_EVENT_CHUNK = 500
+
 def check_token(token: HTTPAuthorizationCredentials = Security(http_bearer)):
     """Vérifier le token via le microservice d'Auth (qui consulte Redis)"""
     credentials = token.credentials
@@ -72,6 +79,98 @@ def create_device(
         logger.error('Create Device - Failed - Error: %s - IP: %s', str(e), request.client.host)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/bulk", response_model=DeviceBulkCreateResponseDTO, status_code=201)
+def create_devices_bulk(
+    request: Request,
+    batch: DeviceBulkCreateDTO,
+    db: Session = Depends(get_db),
+    payload = Depends(check_token)
+):
+    """
+    Enregistrer un lot de devices en une transaction (INSERT multi-lignes ON CONFLICT DO NOTHING)
+    Chaque élément est rapporté created ou duplicate (device_id déjà existant ou répété dans le lot)
+    """
+    import uuid
+    is_admin = payload.get("is_admin", False)
+    user_id = payload.get("id")
+    items = [device.dict() for device in batch.devices]
+    # Vérification RBAC : un non-admin n'enregistre que ses propres devices
+    if not is_admin and any(item['owner_id'] != user_id for item in items):
+        logger.warning('Bulk Create - Access Denied - User: %s - IP: %s', payload.get('sub'), request.client.host)
+        raise HTTPException(status_code=403, detail="Accès non autorisé pour un autre propriétaire")
+    
+    # Générer les device_id manquants ; une répétition dans le lot n'est insérée qu'une fois
+    seen = set()
+    to_insert = []
+    for item in items:
+        if not item.get('device_id'):
+            item['device_id'] = str(uuid.uuid4())
+        if item['device_id'] not in seen:
+            seen.add(item['device_id'])
+            to_insert.append(item)
+    try:
+        created = DeviceDAO.bulk_create(db, to_insert)
+    except Exception as e:
+        logger.error('Bulk Create - Failed - Error: %s - IP: %s', str(e), request.client.host)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    results = []
+    reported = set()
+    for index, item in enumerate(items):
+        device = created.get(item['device_id'])
+        if device and item['device_id'] not in reported:
+            reported.add(item['device_id'])
+            results.append({"index": index, "device_id": item['device_id'], "status": "created", "id": device['id']})
+        else:
+            results.append({"index": index, "device_id": item['device_id'], "status": "duplicate", "id": None})
+    
+    # Un événement groupé par paquet de devices au lieu d'un message par device
+    created_devices = list(created.values())
+    timestamp = datetime.now().isoformat()
+    for start in range(0, len(created_devices), BULK_EVENT_CHUNK):
+        chunk = created_devices[start:start + BULK_EVENT_CHUNK]
+        publish_mqtt_message(MQTT_DEVICE_EVENTS_TOPIC, {
+            "event": "devices_created",
+            "count": len(chunk),
+            "devices": [
+                {key: device[key] for key in ("device_id", "name", "type", "status", "owner_id", "mqtt_topic")}
+                for device in chunk
+            ],
+            "timestamp": timestamp
+        })
+    
+    logger.info('Bulk Create - Success - Created: %s - Duplicates: %s - User: %s - IP: %s',
+                len(created), len(items) - len(created), payload.get('sub'), request.client.host)
+    return {"created": len(created), "duplicates": len(items) - len(created), "items": results}
+
+
+@router.patch("/bulk/status", response_model=DeviceBulkStatusResponseDTO)
+def update_devices_status_bulk(
+    request: Request,
+    batch: DeviceBulkStatusDTO,
+    db: Session = Depends(get_db),
+    payload = Depends(check_token)
+):
+    """
+    Changer le statut d'un lot de devices en une requête (non-admin : ses devices uniquement)
+    """
+    is_admin = payload.get("is_admin", False)
+    user_id = payload.get("id")
+    ids = list(dict.fromkeys(batch.ids))
+    try:
+        updated = DeviceDAO.bulk_update_status(db, ids, batch.status, owner_id=None if is_admin else user_id)
+    except Exception as e:
+        logger.error('Bulk Status - Failed - Error: %s - IP: %s', str(e), request.client.host)
+        raise HTTPException(status_code=500, detail=str(e))
+    updated_set = set(updated)
+    for device_id in updated:
+        heartbeat_buffer.invalidate(device_id)
+    not_found = [device_id for device_id in ids if device_id not in updated_set]
+    logger.info('Bulk Status - Success - Status: %s - Updated: %s - Not Found: %s - User: %s - IP: %s',
+                batch.status, len(updated), len(not_found), payload.get('sub'), request.client.host)
+    return {"status": batch.status, "updated": sorted(updated), "not_found": not_found}
+
+
 @router.put("/{device_id}", response_model=DeviceResponseDTO)
 def update_device(
     request: Request,
@@ -96,6 +195,7 @@ def update_device(
     
     update_data = device_update.dict(exclude_unset=True)
     updated_device = DeviceDAO.update(db, device_id, **update_data)
+    heartbeat_buffer.invalidate(device_id)
     
     logger.info('Update Device - Success - ID: %s - Updated Fields: %s - IP: %s', device_id, list(update_data.keys()), request.client.host)
     return updated_device.to_dict()
@@ -118,6 +218,7 @@ def delete_device(request: Request, device_id: int, db: Session = Depends(get_db
         raise HTTPException(status_code=403, detail="Accès non autorisé pour la suppression")
     
     DeviceDAO.delete(db, device_id)
+    heartbeat_buffer.invalidate(device_id)
     logger.info('Delete Device - Success - ID: %s - By User: %s - IP: %s', device_id, payload.get('sub'), request.client.host)
     return None
 
@@ -126,28 +227,66 @@ def delete_device(request: Request, device_id: int, db: Session = Depends(get_db
 @router.get("/", response_model=List[DeviceResponseDTO])
 def list_devices(
     request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     type: Optional[str] = Query(None, description="Filtrer par type de device"),
+    after_id: Optional[int] = Query(None, ge=0, description="Curseur : id du dernier device de la page précédente (remplace skip)"),
+    with_total: bool = Query(False, description="Renvoyer le total dans X-Total-Count"),
     db: Session = Depends(get_db),
     payload = Depends(check_token)
 ):
     """
-    Lister les devices (Admin: tous, User: les siennes) - Supporte le filtrage par type
+    Lister les devices par id croissant (Admin: tous, User: les siennes) - Supporte le filtrage par type
+    Pagination keyset : X-Next-Cursor contient la valeur de after_id pour la page suivante (absent en fin de liste)
     """
     is_admin = payload.get("is_admin", False)
     user_id = payload.get("id")
     
     if is_admin:
-        devices = DeviceDAO.get_all(db, skip=skip, limit=limit, device_type=type)
+        devices = DeviceDAO.get_all(db, skip=skip, limit=limit, device_type=type, after_id=after_id)
         logger.info('List Devices - Admin - User: %s - Type: %s - IP: %s', payload.get('sub'), type, request.client.host)
     else:
-        devices = DeviceDAO.get_by_owner(db, owner_id=user_id, skip=skip, limit=limit, device_type=type)
+        devices = DeviceDAO.get_by_owner(db, owner_id=user_id, skip=skip, limit=limit, device_type=type, after_id=after_id)
         logger.info('List Devices - User - ID: %s - Type: %s - IP: %s', user_id, type, request.client.host)
     
+    if len(devices) == limit:
+        response.headers["X-Next-Cursor"] = str(devices[-1].id)
+    if with_total:
+        total, estimated = DeviceDAO.count_devices(
+            db, owner_id=None if is_admin else user_id, device_type=type, exact_threshold=DEVICE_COUNT_EXACT_THRESHOLD
+        )
+        response.headers["X-Total-Count"] = str(total)
+        response.headers["X-Total-Estimated"] = "true" if estimated else "false"
+    
     return [device.to_dict() for device in devices]
 
 
+@router.get("/by-device-id/{device_id}", response_model=DeviceResponseDTO)
+def get_device_by_device_id(
+    request: Request,
+    device_id: str,
+    db: Session = Depends(get_db),
+    payload = Depends(check_token)
+):
+    """
+    Récupérer un device par son device_id (identifiant des topics et des métriques), vérifie la propriété si non-admin
+    Utilisé par Device-Monitoring pour autoriser l'abonnement temps réel à un device
+    """
+    device = DeviceDAO.get_by_device_id(db, device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device non trouvé")
+    
+    # Vérification RBAC
+    is_admin = payload.get("is_admin", False)
+    user_id = payload.get("id")
+    if not is_admin and device.owner_id != user_id:
+        logger.warning('Get Device - Access Denied - Device: %s - User: %s - IP: %s', device_id, payload.get('sub'), request.client.host)
+        raise HTTPException(status_code=403, detail="Accès non autorisé")
+    
+    return device.to_dict()
+
+
 @router.get("/{device_id}", response_model=DeviceResponseDTO)
 def get_device(
     request: Request,
@@ -178,21 +317,22 @@ def update_heartbeat(device_id: int, db: Session = Depends(get_db), payload = De
     Mettre à jour le heartbeat (last_seen) d'un device
     Utilisé pour indiquer que le device est actif
     - **device_id**: ID du device
+    
+    last_seen est écrit en base par lot toutes les HEARTBEAT_FLUSH_INTERVAL secondes ;
+    la réponse est servie depuis la ligne du device en cache
     """
-    device = DeviceDAO.get_by_id(db, device_id)
+    device = heartbeat_buffer.record(db, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Device non trouvé")
     
-    updated_device = DeviceDAO.update_last_seen(db, device_id)
-    
     # Publier le message MQTT de heartbeat
     mqtt_message = {
         "event": "heartbeat",
-        "device_id": updated_device.device_id,
-        "status": updated_device.status,
-        "last_seen": updated_device.last_seen.isoformat() if updated_device.last_seen else None,
+        "device_id": device["device_id"],
+        "status": device["status"],
+        "last_seen": device["last_seen"],
         "timestamp": datetime.now().isoformat()
     }
-    publish_mqtt_message(updated_device.mqtt_topic, mqtt_message)
+    publish_mqtt_message(device["mqtt_topic"], mqtt_message)
     
-    return updated_device.to_dict()
+    return device
@@ -1,8 +1,10 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, update, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from entities.device import Device, DeviceStatusEnum
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from datetime import datetime
+import json
 import uuid
 
 
@@ -39,6 +41,53 @@ class DeviceDAO:
         db.refresh(device)
         return device
     
+    @staticmethod
+    def bulk_create(db: Session, devices_data: List[dict], chunk_size: int = 1000) -> Dict[str, dict]:
+        """Insérer un lot de devices en une transaction (INSERT multi-lignes ... ON CONFLICT DO NOTHING).
+        
+        Renvoie les devices créés (to_dict, lu avant le commit qui expire les objets) par device_id :
+        un device_id absent du résultat existait déjà.
+        Les lignes sont envoyées par paquets de chunk_size (limite de paramètres d'une requête).
+        """
+        rows = [{
+            'device_id': data['device_id'],
+            'name': data['name'],
+            'type': data['type'],
+            'location': data.get('location'),
+            'status': data.get('status', DeviceStatusEnum.ACTIVE),
+            'owner_id': data['owner_id'],
+            'mqtt_topic': DeviceDAO.generate_mqtt_topic(data['type'], data['device_id']),
+        } for data in devices_data]
+        created: Dict[str, dict] = {}
+        try:
+            for start in range(0, len(rows), chunk_size):
+                stmt = pg_insert(Device).values(rows[start:start + chunk_size]).on_conflict_do_nothing(
+                    index_elements=[Device.device_id]
+                ).returning(Device)
+                for device in db.scalars(stmt):
+                    created[device.device_id] = device.to_dict()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return created
+    
+    @staticmethod
+    def bulk_update_status(db: Session, ids: List[int], status: str, owner_id: Optional[int] = None) -> List[int]:
+        """Changer le statut d'un lot de devices en une requête ; renvoie les IDs effectivement mis à jour.
+        owner_id restreint la mise à jour aux devices de ce propriétaire (non-admin)."""
+        stmt = update(Device).where(Device.id.in_(ids))
+        if owner_id is not None:
+            stmt = stmt.where(Device.owner_id == owner_id)
+        stmt = stmt.values(status=status, updated_at=datetime.utcnow()).returning(Device.id)
+        try:
+            updated = list(db.scalars(stmt.execution_options(synchronize_session=False)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return updated
+    
     @staticmethod
     def get_by_id(db: Session, device_id: int) -> Optional[Device]:
         """Récupérer un device par son ID"""
@@ -50,20 +99,31 @@ class DeviceDAO:
         return db.query(Device).filter(Device.device_id == device_id).first()
     
     @staticmethod
-    def get_all(db: Session, skip: int = 0, limit: int = 10, device_type: Optional[str] = None) -> List[Device]:
-        """Récupérer tous les devices avec pagination (optionnellement par type)"""
+    def get_all(db: Session, skip: int = 0, limit: int = 10, device_type: Optional[str] = None,
+                after_id: Optional[int] = None) -> List[Device]:
+        """Récupérer tous les devices par id croissant (optionnellement par type).
+        after_id (curseur keyset) remplace skip : latence constante quelle que soit la profondeur."""
         query = db.query(Device)
         if device_type:
             query = query.filter(Device.type == device_type)
-        return query.offset(skip).limit(limit).all()
+        return DeviceDAO._page(query, skip, limit, after_id)
     
     @staticmethod
-    def get_by_owner(db: Session, owner_id: int, skip: int = 0, limit: int = 10, device_type: Optional[str] = None) -> List[Device]:
-        """Récupérer tous les devices d'un propriétaire (optionnellement par type)"""
+    def get_by_owner(db: Session, owner_id: int, skip: int = 0, limit: int = 10, device_type: Optional[str] = None,
+                     after_id: Optional[int] = None) -> List[Device]:
+        """Récupérer tous les devices d'un propriétaire par id croissant (optionnellement par type)"""
         query = db.query(Device).filter(Device.owner_id == owner_id)
         if device_type:
             query = query.filter(Device.type == device_type)
-        return query.offset(skip).limit(limit).all()
+        return DeviceDAO._page(query, skip, limit, after_id)
+    
+    @staticmethod
+    def _page(query, skip: int, limit: int, after_id: Optional[int]) -> List[Device]:
+        if after_id is not None:
+            query = query.filter(Device.id > after_id)
+        else:
+            query = query.offset(skip)
+        return query.order_by(Device.id).limit(limit).all()
     
     @staticmethod
     def get_by_type(db: Session, device_type: str, skip: int = 0, limit: int = 10) -> List[Device]:
@@ -73,16 +133,76 @@ class DeviceDAO:
         ).offset(skip).limit(limit).all()
     
     @staticmethod
-    def count_all(db: Session) -> int:
-        """Compter le nombre total de devices"""
-        return db.query(func.count(Device.id)).scalar()
+    def get_page_after(db: Session, after_id: int = 0, limit: int = 1000, status: Optional[str] = None) -> List[Device]:
+        """Page suivante par ordre d'id (keyset : coût constant quelle que soit la profondeur)"""
+        query = db.query(Device).filter(Device.id > after_id)
+        if status:
+            query = query.filter(Device.status == status)
+        return query.order_by(Device.id).limit(limit).all()
     
     @staticmethod
-    def count_by_owner(db: Session, owner_id: int) -> int:
-        """Compter le nombre de devices d'un propriétaire"""
-        return db.query(func.count(Device.id)).filter(
-            Device.owner_id == owner_id
+    def get_by_ids(db: Session, ids: List[int]) -> List[Device]:
+        """Récupérer plusieurs devices par leurs IDs (les IDs supprimés sont simplement absents)"""
+        if not ids:
+            return []
+        return db.query(Device).filter(Device.id.in_(ids)).all()
+    
+    @staticmethod
+    def get_changed_since(db: Session, since: datetime, limit: int = 1000) -> List[Device]:
+        """Devices créés ou modifiés depuis since (inclus), par updated_at croissant"""
+        return db.query(Device).filter(
+            Device.updated_at >= since
+        ).order_by(Device.updated_at, Device.id).limit(limit).all()
+    
+    @staticmethod
+    def count_all(db: Session, device_type: Optional[str] = None) -> int:
+        """Compter le nombre total de devices (optionnellement par type)"""
+        query = db.query(func.count(Device.id))
+        if device_type:
+            query = query.filter(Device.type == device_type)
+        return query.scalar()
+    
+    @staticmethod
+    def count_by_owner(db: Session, owner_id: int, device_type: Optional[str] = None) -> int:
+        """Compter le nombre de devices d'un propriétaire (optionnellement par type)"""
+        query = db.query(func.count(Device.id)).filter(Device.owner_id == owner_id)
+        if device_type:
+            query = query.filter(Device.type == device_type)
+        return query.scalar()
+    
+    @staticmethod
+    def estimate_count(db: Session, owner_id: Optional[int] = None, device_type: Optional[str] = None) -> Optional[int]:
+        """Estimation du planner, sans parcourir la table : reltuples de pg_class sans filtre,
+        « Plan Rows » de EXPLAIN sinon. None si la table n'a jamais été analysée."""
+        if owner_id is None and not device_type:
+            reltuples = db.execute(text("SELECT reltuples FROM pg_class WHERE oid = 't_devices'::regclass")).scalar()
+            return int(reltuples) if reltuples is not None and reltuples >= 0 else None
+        conditions, params = [], {}
+        if owner_id is not None:
+            conditions.append("owner_id = :owner_id")
+            params['owner_id'] = owner_id
+        if device_type:
+            conditions.append("type = CAST(:device_type AS devicetypeenum)")
+            params['device_type'] = device_type
+        plan = db.execute(
+            text(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM t_devices WHERE {' AND '.join(conditions)}"), params
         ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    
+    @staticmethod
+    def count_devices(db: Session, owner_id: Optional[int] = None, device_type: Optional[str] = None,
+                      exact_threshold: int = 10000) -> Tuple[int, bool]:
+        """Total pour la pagination : (total, estimé).
+        Comptage exact (count_all/count_by_owner) pour les petits ensembles, estimation du planner
+        au-delà de exact_threshold, où un count(*) parcourrait tout l'index à chaque page."""
+        estimate = DeviceDAO.estimate_count(db, owner_id, device_type)
+        if estimate is not None and estimate > exact_threshold:
+            return estimate, True
+        if owner_id is None:
+            return DeviceDAO.count_all(db, device_type), False
+        return DeviceDAO.count_by_owner(db, owner_id, device_type), False
     
     @staticmethod
     def update(db: Session, device_id: int, **kwargs) -> Optional[Device]:
@@ -102,16 +222,30 @@ class DeviceDAO:
         return device
     
     @staticmethod
-    def update_last_seen(db: Session, device_id: int) -> Optional[Device]:
-        """Mettre à jour le timestamp last_seen"""
-        device = DeviceDAO.get_by_id(db, device_id)
-        if not device:
-            return None
-        
-        device.last_seen = datetime.utcnow()
-        db.commit()
-        db.refresh(device)
-        return device
+    def bulk_update_last_seen(db: Session, last_seen_by_id: Dict[int, datetime], chunk_size: int = 1000) -> int:
+        """Écrire les last_seen d'un lot de devices : un UPDATE ... FROM (VALUES ...) par paquet, une transaction.
+        Un last_seen plus récent déjà en base n'est jamais écrasé ; renvoie le nombre de lignes mises à jour."""
+        items = list(last_seen_by_id.items())
+        updated = 0
+        try:
+            for start in range(0, len(items), chunk_size):
+                chunk = items[start:start + chunk_size]
+                values = ", ".join(f"(:id{i}, CAST(:ts{i} AS timestamp))" for i in range(len(chunk)))
+                params = {}
+                for i, (device_id, last_seen) in enumerate(chunk):
+                    params[f"id{i}"] = device_id
+                    params[f"ts{i}"] = last_seen
+                result = db.execute(text(
+                    "UPDATE t_devices AS d SET last_seen = v.ts "
+                    f"FROM (VALUES {values}) AS v(id, ts) "
+                    "WHERE d.id = v.id AND (d.last_seen IS NULL OR d.last_seen < v.ts)"
+                ), params)
+                updated += result.rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return updated
     
     @staticmethod
     def delete(db: Session, device_id: int) -> bool:
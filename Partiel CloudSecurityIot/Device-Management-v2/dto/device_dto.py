@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional
+from typing import Optional, List
 from entities.device import DeviceTypeEnum, DeviceStatusEnum
 
 
@@ -41,3 +41,39 @@ class DeviceResponseDTO(BaseModel):
     
     class Config:
         from_attributes = True
+
+
+class DeviceBulkCreateDTO(BaseModel):
+    """DTO pour l'enregistrement d'un lot de devices (une transaction)"""
+    devices: List[DeviceCreateDTO] = Field(..., min_length=1, max_length=10000, description="Devices à créer")
+
+
+class DeviceBulkItemDTO(BaseModel):
+    """Résultat d'un élément du lot, dans l'ordre de la requête"""
+    index: int
+    device_id: str
+    status: str = Field(..., description="created ou duplicate")
+    id: Optional[int] = None
+
+
+class DeviceBulkCreateResponseDTO(BaseModel):
+    """DTO pour la réponse d'un enregistrement en lot"""
+    created: int
+    duplicates: int
+    items: List[DeviceBulkItemDTO]
+
+
+class DeviceBulkStatusDTO(BaseModel):
+    """DTO pour le changement de statut d'un lot de devices"""
+    ids: List[int] = Field(..., min_length=1, max_length=10000, description="IDs des devices")
+    status: DeviceStatusEnum = Field(..., description="Nouveau statut (active, inactive)")
+    
+    class Config:
+        use_enum_values = True
+
+
+class DeviceBulkStatusResponseDTO(BaseModel):
+    """DTO pour la réponse d'un changement de statut en lot"""
+    status: str
+    updated: List[int]
+    not_found: List[int] = Field(..., description="IDs inexistants ou non autorisés")
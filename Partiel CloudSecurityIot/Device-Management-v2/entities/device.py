@@ -1,5 +1,5 @@
 from helpers.config import Base
-from sqlalchemy import Column, String, Integer, DateTime, func, Enum
+from sqlalchemy import Column, String, Integer, DateTime, func, Enum, Index
 import enum
 
 
@@ -24,6 +24,8 @@ class Device(Base):
     Gère la configuration uniquement - les métriques sont stockées dans ms_monitoring
     """
     __tablename__ = 't_devices'
+    # Listing d'un propriétaire par id croissant (pagination keyset) sans tri
+    __table_args__ = (Index('ix_t_devices_owner_id_id', 'owner_id', 'id'),)
     
     # Identifiants
     id = Column(Integer, primary_key=True, autoincrement=True, nullable=False, index=True)
@@ -62,7 +64,7 @@ class Device(Base):
     
     # Métadonnées temporelles
     created_at = Column(DateTime, server_default=func.now())
-    updated_at = Column(DateTime, server_default=func.now(), server_onupdate=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), server_onupdate=func.now(), index=True)
     last_seen = Column(DateTime, nullable=True)
     
     def to_dict(self):
@@ -11,6 +11,26 @@ MQTT_BROKER_HOST: Final[str] = os.getenv("MQTT_BROKER_HOST", "rabbitmq")
 MQTT_BROKER_PORT: Final[int] = int(os.getenv("MQTT_BROKER_PORT", "1883"))
 MQTT_PUBLISH_INTERVAL: Final[int] = int(os.getenv("MQTT_PUBLISH_INTERVAL", "30"))
 
+# Ensemble des devices actifs du publisher : "notify" (LISTEN/NOTIFY) ou "poll" (watermark updated_at)
+DEVICE_SYNC_MODE: Final[str] = os.getenv("DEVICE_SYNC_MODE", "notify").lower()
+DEVICE_SYNC_INTERVAL: Final[int] = int(os.getenv("DEVICE_SYNC_INTERVAL", "5"))
+DEVICE_RESYNC_INTERVAL: Final[int] = int(os.getenv("DEVICE_RESYNC_INTERVAL", "600"))
+DEVICE_LOAD_PAGE_SIZE: Final[int] = int(os.getenv("DEVICE_LOAD_PAGE_SIZE", "1000"))
+
+# Répartition entre répliques du publisher (hachage cohérent sur device_id) et plafond QoS1 en vol
+PUBLISHER_REPLICAS: Final[int] = int(os.getenv("PUBLISHER_REPLICAS", "1"))
+# Sans variable explicite, l'ordinal d'un pod de StatefulSet (publisher-2 -> 2) est utilisé
+_hostname_ordinal = os.getenv("HOSTNAME", "").rsplit("-", 1)[-1]
+PUBLISHER_REPLICA_INDEX: Final[int] = int(os.getenv(
+    "PUBLISHER_REPLICA_INDEX", _hostname_ordinal if _hostname_ordinal.isdigit() else "0"
+))
+MQTT_MAX_INFLIGHT: Final[int] = int(os.getenv("MQTT_MAX_INFLIGHT", "100"))
+# File bornée des événements MQTT de l'API (création, heartbeat) : au-delà, les événements sont rejetés
+MQTT_EVENT_QUEUE_SIZE: Final[int] = int(os.getenv("MQTT_EVENT_QUEUE_SIZE", "10000"))
+# Topic des événements groupés (enregistrement en lot) : hors de cloud-security-iot/#, souscrit par
+# le consumer de Device-Monitoring-v2 qui y verrait des métriques invalides
+MQTT_DEVICE_EVENTS_TOPIC: Final[str] = os.getenv("MQTT_DEVICE_EVENTS_TOPIC", "device-management/events")
+
 # JWT & Authentification
 SECRET_KEY: Final[str] = os.getenv("SECRET_KEY", "$argon2id$v=19$m=65536,t=3,p=4$hT18aCPZ5AFxQ2ncYkRkWg$5UvBttA1brZmn6Bmf1T0NgKaYaqUzMV1pvWNxDp5pFc")
 EXPIRE_TIME: Final[str] = os.getenv("EXPIRE_TIME", "30")
@@ -28,6 +48,14 @@ API_TITLE: Final[str] = "Device-Management-v2"
 API_VERSION: Final[str] = "1.0.0"
 API_DESCRIPTION: Final[str] = "Microservice de gestion des devices IoT et système pour Cloud Security IoT"
 
+# Listing : au-delà de ce nombre de lignes (estimation du planner), le total renvoyé est estimé
+DEVICE_COUNT_EXACT_THRESHOLD: Final[int] = int(os.getenv("DEVICE_COUNT_EXACT_THRESHOLD", "10000"))
+
+# Heartbeats : écriture groupée de last_seen toutes les N secondes, cache des lignes servies en réponse.
+# TTL court : une modification faite par un autre worker ou une autre réplique n'invalide pas ce cache
+HEARTBEAT_FLUSH_INTERVAL: Final[float] = float(os.getenv("HEARTBEAT_FLUSH_INTERVAL", "2"))
+HEARTBEAT_CACHE_TTL: Final[float] = float(os.getenv("HEARTBEAT_CACHE_TTL", "5"))
+
 # Services externes
 AUTH_SERVICE_URL: Final[str] = os.getenv("AUTH_SERVICE_URL", "http://auth-ms:8000")
 
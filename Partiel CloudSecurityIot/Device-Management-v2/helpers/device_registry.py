@@ -0,0 +1,258 @@
+import json
+import select
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+import psycopg2
+from sqlalchemy import text
+from .config import (
+    DEVICE_LOAD_PAGE_SIZE, DEVICE_RESYNC_INTERVAL, DEVICE_SYNC_INTERVAL, DEVICE_SYNC_MODE,
+    SessionLocal, engine, logger
+)
+from dal.device_dao import DeviceDAO
+from entities.device import DeviceStatusEnum
+
+NOTIFY_CHANNEL = "t_devices_changes"
+SYNC_MODES = ("notify", "poll")
+# Attente maximale entre deux tentatives de démarrage (base pas encore prête, table pas encore créée)
+START_MAX_BACKOFF = 30
+
+# Trigger de notification : seul l'id est envoyé (limite de 8000 octets du payload NOTIFY),
+# la ligne est relue par le publisher. Les heartbeats (last_seen) ne déclenchent rien.
+_TRIGGER_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION notify_t_devices_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{NOTIFY_CHANNEL}', json_build_object(
+            'op', TG_OP, 'id', COALESCE(NEW.id, OLD.id))::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS t_devices_notify ON t_devices",
+    """
+    CREATE TRIGGER t_devices_notify
+    AFTER INSERT OR DELETE OR UPDATE OF status, name, type, location, owner_id, mqtt_topic ON t_devices
+    FOR EACH ROW EXECUTE FUNCTION notify_t_devices_change()
+    """,
+]
+
+# Vue figée d'un device actif : seuls les champs utiles à la publication sont conservés
+ActiveDevice = namedtuple("ActiveDevice", ["id", "device_id", "owner_id", "name", "type", "status", "location", "mqtt_topic"])
+
+def _is_active(device) -> bool:
+    return device.status == DeviceStatusEnum.ACTIVE or device.status == "active"
+
+def _snapshot(device) -> ActiveDevice:
+    return ActiveDevice(device.id, device.device_id, device.owner_id, device.name, device.type,
+                        device.status, device.location, device.mqtt_topic)
+
+class DeviceRegistry:
+    """Ensemble en mémoire des devices actifs, tenu à jour par le flux de changements de t_devices.
+
+    Chargement initial par pages (keyset sur id, sans limite de taille de flotte), puis application
+    incrémentale des changements : LISTEN/NOTIFY (mode "notify", trigger sur t_devices) ou relecture
+    des lignes dont updated_at a dépassé le watermark (mode "poll"). Un rechargement complet périodique
+    (DEVICE_RESYNC_INTERVAL) rattrape les notifications perdues et, en mode poll, les suppressions.
+    """
+
+    def __init__(self, mode: str = DEVICE_SYNC_MODE, page_size: int = DEVICE_LOAD_PAGE_SIZE,
+                 sync_interval: int = DEVICE_SYNC_INTERVAL, resync_interval: int = DEVICE_RESYNC_INTERVAL):
+        if mode not in SYNC_MODES:
+            raise ValueError(f"Unknown DEVICE_SYNC_MODE '{mode}', expected one of {SYNC_MODES}")
+        self.mode = mode
+        self.page_size = page_size
+        self.sync_interval = sync_interval
+        self.resync_interval = resync_interval
+        self._devices: Dict[int, ActiveDevice] = {}
+        # Incrémentée à chaque changement : permet au publisher de ne recalculer son planning qu'au besoin
+        self.version = 0
+        self._lock = threading.Lock()
+        self._watermark = None
+        self._last_resync = 0.0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+
+    # ==================== LECTURE ====================
+    def snapshot(self) -> List[ActiveDevice]:
+        """Devices actifs à l'instant t (copie : itérable sans verrou pendant la publication)"""
+        with self._lock:
+            return list(self._devices.values())
+
+    def __len__(self):
+        return len(self._devices)
+
+    # ==================== CHARGEMENT ====================
+    def load(self):
+        """Chargement complet par pages d'id croissant ; remplace l'ensemble en une fois"""
+        devices: Dict[int, ActiveDevice] = {}
+        watermark = None
+        db = SessionLocal()
+        try:
+            after_id = 0
+            while True:
+                page = DeviceDAO.get_page_after(db, after_id=after_id, limit=self.page_size, status=DeviceStatusEnum.ACTIVE)
+                for device in page:
+                    devices[device.id] = _snapshot(device)
+                if len(page) < self.page_size:
+                    break
+                after_id = page[-1].id
+            # Watermark pris en base (et non sur l'horloge locale) pour le mode poll
+            watermark = db.execute(text("SELECT max(updated_at) FROM t_devices")).scalar()
+        finally:
+            db.close()
+        with self._lock:
+            self._devices = devices
+            self._watermark = watermark
+            self.version += 1
+        self._last_resync = time.monotonic()
+        logger.info(f"[DeviceRegistry] {len(devices)} active devices loaded")
+
+    def apply(self, devices: Iterable, deleted_ids: Iterable[int] = ()):
+        """Applique des lignes relues (ajout, mise à jour, passage inactif) et des suppressions"""
+        changed = False
+        with self._lock:
+            for device in devices:
+                if _is_active(device):
+                    snapshot = _snapshot(device)
+                    if self._devices.get(device.id) != snapshot:
+                        self._devices[device.id] = snapshot
+                        changed = True
+                elif self._devices.pop(device.id, None) is not None:
+                    changed = True
+                if device.updated_at and (self._watermark is None or device.updated_at > self._watermark):
+                    self._watermark = device.updated_at
+            for device_id in deleted_ids:
+                if self._devices.pop(device_id, None) is not None:
+                    changed = True
+            if changed:
+                self.version += 1
+
+    def refresh_ids(self, ids: Iterable[int]):
+        """Relit un lot d'ids notifiés : un id absent de la table a été supprimé"""
+        ids = list(set(ids))
+        db = SessionLocal()
+        try:
+            # Par pages : un import en masse peut notifier des dizaines de milliers d'ids
+            for start in range(0, len(ids), self.page_size):
+                chunk = ids[start:start + self.page_size]
+                rows = DeviceDAO.get_by_ids(db, chunk)
+                found = {device.id for device in rows}
+                self.apply(rows, deleted_ids=[i for i in chunk if i not in found])
+        finally:
+            db.close()
+
+    def poll_changes(self):
+        """Mode poll : relit les lignes modifiées depuis le watermark (avec une marge pour les horloges)"""
+        if self._watermark is None:
+            self.load()
+            return
+        since = self._watermark - timedelta(seconds=self.sync_interval)
+        db = SessionLocal()
+        try:
+            while True:
+                rows = DeviceDAO.get_changed_since(db, since, limit=self.page_size)
+                self.apply(rows)
+                if len(rows) < self.page_size:
+                    break
+                if rows[-1].updated_at <= since:
+                    # Page entière au même updated_at : impossible d'avancer, rechargement complet
+                    self.load()
+                    break
+                since = rows[-1].updated_at
+        finally:
+            db.close()
+
+    # ==================== SYNCHRONISATION ====================
+    def start(self):
+        """Chargement initial (synchrone : le premier cycle de publication voit la flotte) puis thread de synchronisation.
+        Réessayé avec backoff tant que Postgres ou t_devices (créée par l'API) ne sont pas disponibles."""
+        self._running = True
+        attempt = 0
+        while self._running:
+            try:
+                if self.mode == "notify":
+                    self._install_trigger()
+                    self._conn = self._listen_connect()
+                else:
+                    self._ensure_watermark_index()
+                    self.load()
+                break
+            except Exception as e:
+                attempt += 1
+                delay = min(2 ** attempt, START_MAX_BACKOFF)
+                logger.warning(f"[DeviceRegistry] Startup failed (attempt {attempt}), retrying in {delay}s: {e}")
+                print(f"⚠ Device registry startup failed (attempt {attempt}), retrying in {delay}s: {e}", flush=True)
+                time.sleep(delay)
+        self._thread = threading.Thread(target=self._run, name="device-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def _install_trigger(self):
+        with engine.begin() as conn:
+            for statement in _TRIGGER_DDL:
+                conn.execute(text(statement))
+
+    def _ensure_watermark_index(self):
+        # create_all ne crée pas l'index sur une table existante
+        with engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_t_devices_updated_at ON t_devices (updated_at)"))
+
+    def _resync_due(self) -> bool:
+        return self.resync_interval > 0 and time.monotonic() - self._last_resync >= self.resync_interval
+
+    def _run(self):
+        while self._running:
+            try:
+                if self.mode == "notify":
+                    if self._conn is None:
+                        self._conn = self._listen_connect()
+                    self._listen(self._conn)
+                else:
+                    time.sleep(self.sync_interval)
+                    if self._resync_due():
+                        self.load()
+                    else:
+                        self.poll_changes()
+            except Exception as e:
+                logger.error(f"[DeviceRegistry] Sync error: {e}")
+                if self.mode == "notify" and self._conn is not None:
+                    # Notifications perdues pendant la coupure : rechargement complet à la reconnexion
+                    self._conn.close()
+                    self._conn = None
+                time.sleep(2)
+
+    def _listen_connect(self):
+        """Connexion dédiée (hors pool) en autocommit ; LISTEN actif avant le chargement pour ne rien manquer"""
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        conn = psycopg2.connect(dsn)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+            self.load()
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _listen(self, conn):
+        """Boucle LISTEN : les notifications reçues pendant un intervalle sont relues en un seul lot"""
+        while self._running:
+            if select.select([conn], [], [], self.sync_interval) != ([], [], []):
+                conn.poll()
+            ids = set()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    ids.add(int(json.loads(notify.payload)["id"]))
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"[DeviceRegistry] Invalid notification payload: {notify.payload}")
+            if ids:
+                self.refresh_ids(ids)
+            if self._resync_due():
+                self.load()
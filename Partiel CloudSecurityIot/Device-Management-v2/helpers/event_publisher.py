@@ -0,0 +1,163 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Dict, Tuple
+import paho.mqtt.client as mqtt
+from prometheus_client import Counter, Gauge, Histogram
+from .config import MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_EVENT_QUEUE_SIZE, MQTT_MAX_INFLIGHT, logger
+
+# ==================== MÉTRIQUES ====================
+EVENT_QUEUE_DEPTH = Gauge("mqtt_event_queue_depth", "Événements MQTT en attente d'envoi")
+EVENT_INFLIGHT = Gauge("mqtt_event_inflight", "Événements MQTT publiés en attente de PUBACK")
+EVENT_PUBLISH_LATENCY = Histogram(
+    "mqtt_event_publish_latency_seconds", "Délai mise en file -> PUBACK d'un événement MQTT",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+EVENTS_PUBLISHED = Counter("mqtt_events_published_total", "Événements MQTT acquittés par le broker")
+EVENTS_DROPPED = Counter("mqtt_events_dropped_total", "Événements MQTT rejetés (file pleine ou arrêt)")
+
+class EventPublisher:
+    """Publisher MQTT des événements de l'API (création, heartbeat...) : une connexion persistante par
+    worker, reconnectée par paho, alimentée par une file bornée vidée par un thread de fond.
+
+    publish() ne bloque jamais la requête HTTP : si la file est pleine (broker lent ou injoignable),
+    l'événement est rejeté et compté. Les messages QoS1 non acquittés sont plafonnés à max_inflight.
+    """
+
+    def __init__(self, maxsize: int = MQTT_EVENT_QUEUE_SIZE, max_inflight: int = MQTT_MAX_INFLIGHT):
+        self.queue: "queue.Queue[Tuple[str, str, float]]" = queue.Queue(maxsize=maxsize)
+        self.max_inflight = max_inflight
+        self.client = mqtt.Client(client_id=f"device_management_{os.getpid()}_{random.randint(1000, 9999)}")
+        self.client.max_inflight_messages_set(max_inflight)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+        self.connected = threading.Event()
+        # mid -> instant de mise en file, pour la latence jusqu'au PUBACK
+        self._pending: Dict[int, float] = {}
+        # PUBACK reçus avant l'enregistrement du mid (mid -> instant de réception)
+        self._early: Dict[int, float] = {}
+        # Places en vol réservées par le thread d'envoi, publish() en cours
+        self._reserved = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        EVENT_QUEUE_DEPTH.set_function(self.queue.qsize)
+        EVENT_INFLIGHT.set_function(lambda: len(self._pending))
+
+    # ==================== CYCLE DE VIE ====================
+    def start(self):
+        """Connexion asynchrone (le démarrage de l'API n'attend pas le broker) et thread d'envoi"""
+        if self._running:
+            return
+        self._running = True
+        self.client.connect_async(MQTT_BROKER_HOST, MQTT_BROKER_PORT, keepalive=60)
+        self.client.loop_start()
+        self._thread = threading.Thread(target=self._flush_loop, name="mqtt-event-publisher", daemon=True)
+        self._thread.start()
+        logger.info(f"[EventPublisher] Started - Broker: {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+
+    def stop(self, timeout: float = 5.0):
+        """Vide la file (dans la limite de timeout) puis ferme la connexion"""
+        deadline = time.monotonic() + timeout
+        while (not self.queue.empty() or self._pending) and self.connected.is_set() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+        lost = self.queue.qsize()
+        if lost:
+            EVENTS_DROPPED.inc(lost)
+            logger.warning(f"[EventPublisher] {lost} events dropped at shutdown")
+        self.client.disconnect()
+        self.client.loop_stop()
+        logger.info("[EventPublisher] Stopped")
+
+    # ==================== CALLBACKS MQTT ====================
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            with self._cond:
+                # Session propre : les messages en vol de la connexion précédente ne seront plus acquittés
+                self._pending.clear()
+                self._early.clear()
+                self._cond.notify_all()
+            self.connected.set()
+            logger.info("[EventPublisher] Connected to MQTT Broker")
+        else:
+            logger.error(f"[EventPublisher] Failed to connect, return code {rc}")
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        if rc != 0:
+            logger.warning(f"[EventPublisher] Disconnected from MQTT Broker with code {rc}, reconnecting")
+
+    def on_publish(self, client, userdata, mid):
+        # Appelé par paho sous son verrou interne : _cond n'est jamais tenu pendant client.publish()
+        now = time.monotonic()
+        with self._cond:
+            queued_at = self._pending.pop(mid, None)
+            if queued_at is None:
+                self._early[mid] = now
+                return
+            self._cond.notify()
+        self._acked(queued_at, now)
+
+    @staticmethod
+    def _acked(queued_at: float, acked_at: float):
+        EVENT_PUBLISH_LATENCY.observe(acked_at - queued_at)
+        EVENTS_PUBLISHED.inc()
+
+    # ==================== ENVOI ====================
+    def publish(self, topic: str, message: dict) -> bool:
+        """Met un événement en file sans bloquer ; False s'il est rejeté (file pleine)"""
+        try:
+            self.queue.put_nowait((topic, json.dumps(message, default=str), time.monotonic()))
+            return True
+        except queue.Full:
+            EVENTS_DROPPED.inc()
+            logger.warning(f"[EventPublisher] Queue full, event dropped for {topic}")
+            return False
+
+    def _flush_loop(self):
+        while self._running:
+            try:
+                topic, payload, queued_at = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # Broker injoignable : l'événement attend la reconnexion, la file bornée absorbe le reste
+            while self._running and not self.connected.wait(timeout=0.5):
+                pass
+            if not self._running:
+                EVENTS_DROPPED.inc()
+                break
+            # Réservation de la place en vol sous _cond, publish() hors verrou : paho appelle
+            # on_publish en tenant son propre verrou, l'ordre inverse provoquerait un interblocage
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._pending) + self._reserved < self.max_inflight or not self._running, timeout=5
+                )
+                self._reserved += 1
+            try:
+                result = self.client.publish(topic, payload, qos=1)
+            except Exception as e:
+                result = None
+                logger.error(f"[EventPublisher] Failed to publish to {topic}: {e}")
+            with self._cond:
+                self._reserved -= 1
+                if result is None or result.rc != mqtt.MQTT_ERR_SUCCESS:
+                    EVENTS_DROPPED.inc()
+                    if result is not None:
+                        logger.error(f"[EventPublisher] Failed to publish to {topic}, rc: {result.rc}")
+                    continue
+                acked_at = self._early.pop(result.mid, None)
+                if acked_at is None:
+                    self._pending[result.mid] = queued_at
+            if acked_at is not None:
+                self._acked(queued_at, acked_at)
+
+# Une instance par worker uvicorn, démarrée et arrêtée par le lifespan de l'application
+event_publisher = EventPublisher()
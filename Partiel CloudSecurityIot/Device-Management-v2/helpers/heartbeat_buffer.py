@@ -0,0 +1,99 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from prometheus_client import Gauge, Histogram
+from sqlalchemy.orm import Session
+from .config import HEARTBEAT_CACHE_TTL, HEARTBEAT_FLUSH_INTERVAL, SessionLocal, logger
+from dal.device_dao import DeviceDAO
+
+HEARTBEAT_PENDING = Gauge("device_heartbeat_pending", "Heartbeats en attente d'écriture dans t_devices")
+HEARTBEAT_FLUSH_DURATION = Histogram("device_heartbeat_flush_seconds", "Durée d'une écriture groupée des heartbeats")
+
+class HeartbeatBuffer:
+    """Écriture différée des heartbeats : last_seen est gardé en mémoire et écrit toutes les
+    flush_interval secondes par un seul UPDATE ... FROM (VALUES ...) pour tous les devices concernés.
+
+    La réponse est construite depuis une copie en cache de la ligne du device (TTL court, invalidée
+    localement par les modifications du device) : un heartbeat ne coûte plus d'aller-retour Postgres
+    tant que le device est en cache. Contrepartie : last_seen lu en base a jusqu'à flush_interval de retard.
+    """
+
+    def __init__(self, flush_interval: float = HEARTBEAT_FLUSH_INTERVAL, cache_ttl: float = HEARTBEAT_CACHE_TTL):
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self._pending: Dict[int, datetime] = {}
+        # id -> (to_dict du device, instant de mise en cache)
+        self._rows: Dict[int, Tuple[dict, float]] = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        HEARTBEAT_PENDING.set_function(lambda: len(self._pending))
+
+    # ==================== CYCLE DE VIE ====================
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._flush_loop, name="heartbeat-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Arrêt du thread puis écriture des derniers heartbeats"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    # ==================== HEARTBEATS ====================
+    def record(self, db: Session, device_id: int) -> Optional[dict]:
+        """Enregistre le heartbeat et renvoie la ligne du device à jour (None si le device n'existe pas)"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._rows.get(device_id)
+        if cached is None or now - cached[1] > self.cache_ttl:
+            device = DeviceDAO.get_by_id(db, device_id)
+            if not device:
+                self.invalidate(device_id)
+                return None
+            cached = (device.to_dict(), now)
+        last_seen = datetime.utcnow()
+        with self._lock:
+            self._rows[device_id] = cached
+            self._pending[device_id] = last_seen
+        return dict(cached[0], last_seen=last_seen.isoformat())
+
+    def invalidate(self, device_id: int):
+        """À appeler quand un device est modifié ou supprimé dans ce worker"""
+        with self._lock:
+            self._rows.pop(device_id, None)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            # Purge des lignes expirées (devices qui ne battent plus)
+            now = time.monotonic()
+            self._rows = {i: row for i, row in self._rows.items() if now - row[1] <= self.cache_ttl}
+        if not pending:
+            return
+        db = SessionLocal()
+        try:
+            with HEARTBEAT_FLUSH_DURATION.time():
+                DeviceDAO.bulk_update_last_seen(db, pending)
+        except Exception as e:
+            logger.error(f"[Heartbeat] Flush of {len(pending)} heartbeats failed, retrying next cycle: {e}")
+            with self._lock:
+                # Réinjection sans écraser un heartbeat plus récent reçu entre-temps
+                for device_id, last_seen in pending.items():
+                    if device_id not in self._pending:
+                        self._pending[device_id] = last_seen
+        finally:
+            db.close()
+
+    def _flush_loop(self):
+        while self._running:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+# Une instance par worker uvicorn, démarrée et arrêtée par le lifespan de l'application
+heartbeat_buffer = HeartbeatBuffer()
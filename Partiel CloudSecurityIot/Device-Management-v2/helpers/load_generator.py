@@ -0,0 +1,192 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+import paho.mqtt.client as mqtt
+from .config import MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_MAX_INFLIGHT, logger
+from .mqtt_publisher import VALUE_RANGES
+from dal.device_dao import DeviceDAO
+
+DEFAULT_TYPES = list(VALUE_RANGES) + ["system"]
+
+class LoadGenerator:
+    """Générateur de charge MQTT : N devices virtuels par type, sans ligne dans t_devices.
+
+    Les payloads ont le format du publisher (le consumer de Device-Monitoring-v2 les traite comme de
+    vraies mesures) : la partie constante de chaque device est sérialisée une seule fois, les valeurs
+    d'un lot sont tirées d'un coup avec numpy et le timestamp est commun au lot. Le débit total visé
+    est réparti en round-robin sur tous les devices virtuels.
+
+    Rapport périodique : débit envoyé et acquitté, latence publish -> PUBACK (QoS1), messages en vol,
+    temps passé bloqué sur le plafond d'in-flight (contre-pression du broker) et retard sur la cible.
+    """
+
+    def __init__(self, devices_per_type: int, rate: float, duration: float = 0, types: Optional[List[str]] = None,
+                 owner_id: int = 0, qos: int = 1, batch_size: int = 1000, report_every: float = 10,
+                 max_inflight: int = MQTT_MAX_INFLIGHT, prefix: str = "loadtest"):
+        self.rate = rate
+        self.duration = duration
+        self.qos = qos
+        self.batch_size = batch_size
+        self.report_every = report_every
+        self.max_inflight = max_inflight
+        self.client = mqtt.Client(client_id=f"loadgen_{random.randint(1000, 9999)}")
+        self.client.max_inflight_messages_set(max_inflight)
+        self.client.on_publish = self.on_publish
+        self.rng = np.random.default_rng()
+        self._build_fleet(devices_per_type, types or DEFAULT_TYPES, owner_id, prefix)
+
+        # Messages publiés non acquittés : mid -> instant d'envoi
+        self._pending: Dict[int, float] = {}
+        self._early: Dict[int, float] = {}
+        self._cond = threading.Condition()
+        self._latencies: List[float] = []
+        self.sent = 0
+        self.acked = 0
+        self.errors = 0
+        self.stalled = 0.0
+
+    def _build_fleet(self, devices_per_type: int, types: List[str], owner_id: int, prefix: str):
+        topics, prefixes, lows, spans, system = [], [], [], [], []
+        for device_type in types:
+            low, high, unit = VALUE_RANGES.get(device_type, (0, 100, "%"))
+            for i in range(devices_per_type):
+                device_id = f"{prefix}-{device_type}-{i:06d}"
+                topics.append(DeviceDAO.generate_mqtt_topic(device_type, device_id))
+                static = json.dumps({
+                    "device_id": device_id,
+                    "owner_id": owner_id,
+                    "name": f"Load {device_type} {i}",
+                    "type": device_type,
+                    "unit": unit,
+                    "status": "active",
+                    "location": "loadtest",
+                })
+                # Préfixe JSON sans l'accolade fermante : value et timestamp sont ajoutés par message
+                prefixes.append(static[:-1])
+                lows.append(low)
+                spans.append(high - low)
+                system.append(device_type == "system")
+        self.topics = topics
+        self.prefixes = prefixes
+        self.lows = np.array(lows, dtype=np.float64)
+        self.spans = np.array(spans, dtype=np.float64)
+        self.system = np.array(system, dtype=bool)
+        self.cursor = 0
+
+    # ==================== MQTT ====================
+    def connect(self, retries: int = 30):
+        for attempt in range(1, retries + 1):
+            try:
+                self.client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, keepalive=60)
+                self.client.loop_start()
+                return
+            except Exception as e:
+                logger.warning(f"[LOADGEN] Connection failed ({attempt}/{retries}), retrying in 2s: {e}")
+                time.sleep(2)
+        raise Exception("Could not connect to MQTT Broker after multiple retries")
+
+    def on_publish(self, client, userdata, mid):
+        now = time.perf_counter()
+        with self._cond:
+            sent_at = self._pending.pop(mid, None)
+            if sent_at is None:
+                # Acquittement reçu avant l'enregistrement du mid (publish() n'a pas encore rendu la main)
+                self._early[mid] = now
+                return
+            self._latencies.append(now - sent_at)
+            self.acked += 1
+            self._cond.notify()
+
+    # ==================== GÉNÉRATION ====================
+    def _batch(self, n: int):
+        """n messages (topic, payload) des devices suivants, valeurs tirées en un seul appel numpy"""
+        index = (self.cursor + np.arange(n)) % len(self.topics)
+        self.cursor = int(index[-1] + 1) % len(self.topics)
+        values = (self.lows[index] + self.rng.random(n) * self.spans[index]).round(2).tolist()
+        ram = (self.rng.random(n) * 100).round(2).tolist()
+        system = self.system[index].tolist()
+        timestamp = datetime.now().isoformat()
+        tail = f',"timestamp":"{timestamp}"}}'
+        batch = []
+        for i, device in enumerate(index.tolist()):
+            if system[i]:
+                value = f'{{"cpu_percent":{values[i]},"ram_percent":{ram[i]}}}'
+            else:
+                value = values[i]
+            batch.append((self.topics[device], f'{self.prefixes[device]},"value":{value}{tail}'))
+        return batch
+
+    def _publish(self, topic: str, payload: str):
+        with self._cond:
+            if len(self._pending) >= self.max_inflight:
+                # Contre-pression : le broker n'acquitte pas assez vite
+                waited = time.perf_counter()
+                self._cond.wait_for(lambda: len(self._pending) < self.max_inflight, timeout=5)
+                self.stalled += time.perf_counter() - waited
+        # publish() hors de _cond : paho appelle on_publish en tenant son propre verrou
+        sent_at = time.perf_counter()
+        result = self.client.publish(topic, payload, qos=self.qos)
+        with self._cond:
+            if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                self.errors += 1
+                return
+            self.sent += 1
+            acked_at = self._early.pop(result.mid, None)
+            if acked_at is not None:
+                self._latencies.append(acked_at - sent_at)
+                self.acked += 1
+            else:
+                self._pending[result.mid] = sent_at
+
+    def run(self):
+        self.connect()
+        fleet = len(self.topics)
+        print(f"[LOADGEN] {fleet} virtual devices, target {self.rate:.0f} msg/s "
+              f"(one reading every {fleet / self.rate:.1f}s per device), QoS {self.qos}", flush=True)
+        start = last_report = time.monotonic()
+        last_sent = last_acked = 0
+        last_stalled = 0.0
+        try:
+            while not self.duration or time.monotonic() - start < self.duration:
+                now = time.monotonic()
+                due = int(self.rate * (now - start)) - self.sent - self.errors
+                if due > 0:
+                    for topic, payload in self._batch(min(due, self.batch_size)):
+                        self._publish(topic, payload)
+                else:
+                    next_at = start + (self.sent + self.errors + 1) / self.rate
+                    time.sleep(max(0.0, min(0.01, next_at - now)))
+                if now - last_report >= self.report_every:
+                    self._report(now - last_report, self.sent - last_sent, self.acked - last_acked,
+                                 self.stalled - last_stalled, due)
+                    last_report, last_sent, last_acked, last_stalled = now, self.sent, self.acked, self.stalled
+        except KeyboardInterrupt:
+            print("\n[LOADGEN] Stopped by user", flush=True)
+        finally:
+            # Laisse arriver les derniers PUBACK avant le bilan
+            with self._cond:
+                self._cond.wait_for(lambda: not self._pending, timeout=5)
+            elapsed = time.monotonic() - start
+            print(f"[LOADGEN] Total: {self.sent} sent, {self.acked} acked, {self.errors} errors in {elapsed:.1f}s "
+                  f"({self.sent / elapsed:.0f} msg/s), blocked on in-flight cap {self.stalled:.1f}s", flush=True)
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def _report(self, window: float, sent: int, acked: int, stalled: float, lag: int):
+        with self._cond:
+            latencies, self._latencies = self._latencies, []
+            inflight = len(self._pending)
+        if latencies:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            latency = f"p50 {p50:.1f}ms p95 {p95:.1f}ms p99 {p99:.1f}ms max {max(latencies) * 1000:.1f}ms"
+        else:
+            latency = "no ack"
+        line = (f"[LOADGEN] sent {sent / window:.0f} msg/s (target {self.rate:.0f}), acked {acked / window:.0f} msg/s, "
+                f"latency {latency}, in-flight {inflight}/{self.max_inflight}, "
+                f"blocked {100 * stalled / window:.0f}% of the time, lag {max(lag, 0)} msgs")
+        logger.info(line)
+        print(line, flush=True)
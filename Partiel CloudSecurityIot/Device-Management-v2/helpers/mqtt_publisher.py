@@ -5,12 +5,27 @@ import random
 from datetime import datetime
 import psutil
 import os
-from .config import MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_PUBLISH_INTERVAL, SessionLocal, logger
-from dal.device_dao import DeviceDAO
-from entities.device import DeviceStatusEnum
+import threading
+from .config import (
+    MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_PUBLISH_INTERVAL, MQTT_MAX_INFLIGHT,
+    PUBLISHER_REPLICAS, PUBLISHER_REPLICA_INDEX, logger
+)
+from .device_registry import DeviceRegistry
+from .publish_schedule import build_schedule
 
 # Configurable system metric: cpu, ram, both (default: both)
 SYSTEM_METRIC = os.getenv("SYSTEM_METRIC", "both").lower()
+# Plage de valeurs simulées et unité par type de capteur (system : métriques CPU/RAM réelles)
+VALUE_RANGES = {
+    "temperature": (15, 30, "°C"),
+    "humidity": (30, 80, "%"),
+    "pressure": (1000, 1050, "hPa"),
+    "light": (0, 100, "%"),
+}
+# En dessous de ce délai, un device en avance est publié tout de suite (pas de sleep par device)
+SCHEDULE_TICK = 0.01
+# Attente maximale d'une place QoS1 avant d'abandonner la mesure du cycle
+INFLIGHT_WAIT_TIMEOUT = 5.0
 
 class MQTTPublisher:
     """Helper class to handle MQTT publication for devices"""
@@ -22,12 +37,30 @@ class MQTTPublisher:
         self.MQTT_PUBLISH_INTERVAL = int(MQTT_PUBLISH_INTERVAL)
         self.client = mqtt.Client(client_id=f"publisher_{random.randint(1000, 9999)}")
         self.connected = False
+        # Devices actifs en mémoire, synchronisés sur les changements de t_devices
+        self.registry = DeviceRegistry()
+        self.replicas = PUBLISHER_REPLICAS
+        self.replica_index = PUBLISHER_REPLICA_INDEX
+        self._schedule = []
+        self._schedule_version = None
+        # Messages QoS1 publiés et pas encore acquittés (PUBACK) : plafonnés à max_inflight
+        self.max_inflight = MQTT_MAX_INFLIGHT
+        self.client.max_inflight_messages_set(self.max_inflight)
+        self._inflight = 0
+        self._inflight_cond = threading.Condition()
+        self.skipped = 0
+        # Passe à True au premier délai d'attente dépassé : le reste du cycle est sauté sans attendre
+        self._saturated = False
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.connected = True
             logger.info("Connected to MQTT Broker!")
             print("✓ Connected to MQTT Broker")
+            # Les messages en vol d'une session précédente ne seront pas tous acquittés
+            with self._inflight_cond:
+                self._inflight = 0
+                self._inflight_cond.notify_all()
         else:
             logger.error(f"Failed to connect, return code {rc}")
             print(f"✗ Failed to connect, return code {rc}")
@@ -37,14 +70,33 @@ class MQTTPublisher:
         logger.warning(f"Disconnected from MQTT Broker with code {rc}")
         print(f"⚠ Disconnected from MQTT Broker")
 
+    def on_publish(self, client, userdata, mid):
+        # PUBACK reçu (QoS1) : libère une place. Le compteur peut passer brièvement sous 0 si le PUBACK
+        # arrive avant que _published() ait compté le message
+        with self._inflight_cond:
+            self._inflight -= 1
+            self._inflight_cond.notify()
+
+    def _wait_inflight(self) -> bool:
+        """Attend une place parmi les messages en vol ; False si le broker n'acquitte plus"""
+        with self._inflight_cond:
+            return self._inflight_cond.wait_for(lambda: self._inflight < self.max_inflight, timeout=INFLIGHT_WAIT_TIMEOUT)
+
+    def _published(self):
+        # Place comptée seulement pour un publish() accepté : paho acquittera (et appellera on_publish) ce message
+        with self._inflight_cond:
+            self._inflight += 1
+
     def start(self):
         """Start the publication loop"""
         self.running = True
         logger.info(f"MQTT Publisher starting - Broker: {self.MQTT_BROKER_HOST}:{self.MQTT_BROKER_PORT}")
-        print(f"✓ MQTT Publisher service started - Interval: {self.MQTT_PUBLISH_INTERVAL}s", flush=True)
+        print(f"✓ MQTT Publisher service started - Interval: {self.MQTT_PUBLISH_INTERVAL}s "
+              f"- Replica {self.replica_index + 1}/{self.replicas}", flush=True)
         
         self.client.on_connect = self.on_connect
         self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
         
         try:
             self.client.loop_start()
@@ -67,6 +119,7 @@ class MQTTPublisher:
             
             if not connected:
                 raise Exception("Could not connect to MQTT Broker after multiple retries")
+            self.registry.start()
             self._publish_loop()
         except KeyboardInterrupt:
             logger.info("MQTT Publisher stopped by user")
@@ -76,12 +129,17 @@ class MQTTPublisher:
             print(f"✗ MQTT Publisher error: {e}")
         finally:
             self.running = False
+            self.registry.stop()
             self.client.loop_stop()
             self.client.disconnect()
     
     def _publish_loop(self):
+        """Chaque device est publié une fois par intervalle, à son décalage de phase : la charge est
+        étalée sur tout l'intervalle au lieu d'une rafale, et chaque réplique ne publie que sa part"""
         while self.running:
             try:
+                cycle_start = time.monotonic()
+                self._saturated = False
                 # Synchronisation : on sample les métriques système une seule fois pour tout le cycle
                 system_metrics = {
                     "cpu_percent": psutil.cpu_percent(interval=0.1),
@@ -90,43 +148,49 @@ class MQTTPublisher:
                 logger.info(f"[BATCH_SYNC] New metrics sampled: {system_metrics}")
                 print(f"DEBUG: [BATCH_SYNC] System metrics sampled: {system_metrics}", flush=True)
                 
-                self._publish_all_devices(system_metrics)
-                time.sleep(self.MQTT_PUBLISH_INTERVAL)
+                self._publish_all_devices(system_metrics, cycle_start)
+                remaining = cycle_start + self.MQTT_PUBLISH_INTERVAL - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+                if self.skipped:
+                    logger.warning(f"[BACKPRESSURE] {self.skipped} publications skipped this cycle: broker not acking "
+                                   f"within {INFLIGHT_WAIT_TIMEOUT}s (max in-flight: {self.max_inflight})")
+                    self.skipped = 0
             except Exception as e:
                 logger.error(f"Error in publish loop: {e}")
                 time.sleep(1)
     
-    def _publish_all_devices(self, system_metrics=None):
-        db = SessionLocal()
-        try:
-            devices = DeviceDAO.get_all(db, skip=0, limit=1000)
-            if not devices:
-                return
-            for device in devices:
-                if device.status == DeviceStatusEnum.ACTIVE or device.status == 'active':
-                    self._publish_device_data(device, system_metrics)
-        except Exception as e:
-            logger.error(f"Error fetching devices: {e}")
-        finally:
-            db.close()
+    def _current_schedule(self):
+        """Planning (offset, device) de cette réplique, recalculé seulement si le registre a changé"""
+        if self._schedule_version != self.registry.version:
+            version = self.registry.version
+            self._schedule = build_schedule(self.registry.snapshot(), self.MQTT_PUBLISH_INTERVAL,
+                                            self.replicas, self.replica_index)
+            self._schedule_version = version
+        return self._schedule
+
+    def _publish_all_devices(self, system_metrics=None, cycle_start=None):
+        # Aucun accès base par cycle : le registre ne contient que les devices actifs
+        if cycle_start is None:
+            cycle_start = time.monotonic()
+        for offset, device in self._current_schedule():
+            if not self.running:
+                break
+            delay = cycle_start + offset - time.monotonic()
+            if delay > SCHEDULE_TICK:
+                time.sleep(delay)
+            self._publish_device_data(device, system_metrics)
     
     def _publish_device_data(self, device, system_metrics=None):
         try:
             if not self.connected:
                 return
 
-            if device.type == 'temperature':
-                value = round(random.uniform(15, 30), 2)
-                unit = "°C"
-            elif device.type == 'humidity':
-                value = round(random.uniform(30, 80), 2)
-                unit = "%"
-            elif device.type == 'pressure':
-                value = round(random.uniform(1000, 1050), 2)
-                unit = "hPa"
-            elif device.type == 'light':
-                value = round(random.uniform(0, 100), 2)
-                unit = "%"
+            # Enum -> str : le hash d'un membre d'Enum n'est pas celui de sa valeur
+            device_type = getattr(device.type, "value", device.type)
+            if device_type in VALUE_RANGES:
+                low, high, unit = VALUE_RANGES[device_type]
+                value = round(random.uniform(low, high), 2)
             elif device.type == 'system':
                 # Utilisation des métriques synchronisées s'il y en a
                 if system_metrics:
@@ -156,8 +220,14 @@ class MQTTPublisher:
                 "timestamp": datetime.now().isoformat()
             }
             
+            if self._saturated or not self._wait_inflight():
+                # Broker saturé : une seule attente par cycle, les devices suivants sont sautés et comptés
+                self._saturated = True
+                self.skipped += 1
+                return
             result = self.client.publish(device.mqtt_topic, json.dumps(message), qos=1)
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._published()
                 logger.info(f"Published to {device.mqtt_topic}: {value}{unit}")
             else:
                 logger.error(f"Failed to publish to {device.mqtt_topic}, rc: {result.rc}")
@@ -0,0 +1,29 @@
+import hashlib
+from typing import List, Tuple
+
+# Hachages stables (hash() de Python est randomisé par processus) : le même device obtient la même
+# phase et la même réplique sur tous les publishers et à chaque redémarrage
+_MAX = float(1 << 64)
+
+def stable_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+def phase_offset(device_id: str, interval: float) -> float:
+    """Décalage du device dans l'intervalle de publication, uniforme sur [0, interval["""
+    return stable_hash(f"phase:{device_id}") / _MAX * interval
+
+def replica_for(device_id: str, replicas: int) -> int:
+    """Réplique propriétaire du device (hachage de rendez-vous) : passer de N à N+1 répliques
+    ne déplace qu'environ 1/(N+1) des devices, tous vers la nouvelle réplique"""
+    if replicas <= 1:
+        return 0
+    return max(range(replicas), key=lambda replica: stable_hash(f"{replica}:{device_id}"))
+
+def build_schedule(devices, interval: float, replicas: int = 1, replica_index: int = 0) -> List[Tuple[float, object]]:
+    """Devices de cette réplique triés par décalage : (offset en secondes, device)"""
+    schedule = [
+        (phase_offset(device.device_id, interval), device) for device in devices
+        if replica_for(device.device_id, replicas) == replica_index
+    ]
+    schedule.sort(key=lambda item: item[0])
+    return schedule
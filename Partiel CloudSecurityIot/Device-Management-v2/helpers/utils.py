@@ -1,9 +1,7 @@
 from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
-from helpers.config import SECRET_KEY, EXPIRE_TIME, MQTT_BROKER_HOST, MQTT_BROKER_PORT
-import paho.mqtt.client as mqtt
-import json
-import threading
+from helpers.config import SECRET_KEY, EXPIRE_TIME
+from helpers.event_publisher import event_publisher
 
 def create_token(data: dict):
     """Créer un JWT token"""
@@ -26,18 +24,6 @@ def decode_token(token: str):
         return False
     return False
 
-def publish_mqtt_message(topic: str, message: dict):
-    """Publier un message MQTT de manière asynchrone"""
-    def _publish():
-        try:
-            client = mqtt.Client()
-            client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, keepalive=60)
-            client.publish(topic, json.dumps(message), qos=1)
-            client.disconnect()
-            print(f"✓ MQTT message published to {topic}")
-        except Exception as e:
-            print(f"✗ MQTT publish error: {e}")
-    
-    # Publier en arrière-plan pour ne pas bloquer la réponse HTTP
-    thread = threading.Thread(target=_publish, daemon=True)
-    thread.start()
+def publish_mqtt_message(topic: str, message: dict) -> bool:
+    """Publier un message MQTT sans bloquer la réponse HTTP (file du publisher persistant du worker)"""
+    return event_publisher.publish(topic, message)
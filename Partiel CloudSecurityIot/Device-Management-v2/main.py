@@ -1,17 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 from helpers.config import Base, engine, API_TITLE, API_VERSION, API_DESCRIPTION
+from helpers.event_publisher import event_publisher
+from helpers.heartbeat_buffer import heartbeat_buffer
 from controllers.device_controller import router as device_router
 
 # Créer les tables
 Base.metadata.create_all(bind=engine)
+# create_all ne touche pas une table existante : ajout des index déclarés depuis sa création
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connexion MQTT persistante et écriture différée des heartbeats du worker : démarrées avec
+    l'application, vidées à l'arrêt"""
+    event_publisher.start()
+    heartbeat_buffer.start()
+    yield
+    heartbeat_buffer.stop()
+    event_publisher.stop()
+
 
 # Créer l'application FastAPI
 app = FastAPI(
     title=API_TITLE,
     version=API_VERSION,
-    description=API_DESCRIPTION
+    description=API_DESCRIPTION,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -21,6 +41,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Total-Estimated"],
 )
 
 # Inclure les routes
@@ -1,7 +1,11 @@
 """
 Service MQTT pour publier les données des devices
 Désormais architecturé via helpers/mqtt_publisher.py
+
+Mode génération de charge (devices virtuels, aucune ligne dans t_devices) :
+    python mqtt_publisher_service.py --load --devices-per-type 20000 --rate 5000 --duration 300
 """
+import argparse
 import sys
 import os
 
@@ -10,7 +14,35 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from helpers.mqtt_publisher import MQTTPublisher
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Publisher MQTT des devices")
+    parser.add_argument("--load", action="store_true", help="Mode génération de charge (devices virtuels)")
+    parser.add_argument("--devices-per-type", type=int, default=1000, help="Devices virtuels par type")
+    parser.add_argument("--rate", type=float, default=1000, help="Débit total visé (messages/s)")
+    parser.add_argument("--duration", type=float, default=0, help="Durée en secondes (0 : jusqu'à Ctrl+C)")
+    parser.add_argument("--types", default=None, help="Types simulés, séparés par des virgules (défaut : tous)")
+    parser.add_argument("--owner-id", type=int, default=0, help="owner_id des payloads")
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=1)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Messages générés par lot")
+    parser.add_argument("--report-every", type=float, default=10, help="Période du rapport en secondes")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    print("=== MQTT Publisher Service Starting ===", flush=True)
-    publisher = MQTTPublisher()
-    publisher.start()
+    args = parse_args()
+    if args.load:
+        from helpers.load_generator import LoadGenerator
+        print("=== MQTT Load Generator Starting ===", flush=True)
+        LoadGenerator(
+            devices_per_type=args.devices_per_type,
+            rate=args.rate,
+            duration=args.duration,
+            types=args.types.split(",") if args.types else None,
+            owner_id=args.owner_id,
+            qos=args.qos,
+            batch_size=args.batch_size,
+            report_every=args.report_every,
+        ).run()
+    else:
+        print("=== MQTT Publisher Service Starting ===", flush=True)
+        publisher = MQTTPublisher()
+        publisher.start()
@@ -1,8 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pymongo import MongoClient
-from dal.metric_dal import MetricDAL
+from motor.motor_asyncio import AsyncIOMotorClient
+from dal.metric_archive import MetricArchive, hot_window_start
+from dal.metric_dal import RETENTION_SECONDS, naive_utc
+from dal.metric_storage import create_metric_dal
+from dal.metric_async_dal import AsyncMetricDAL
+from dal.metric_rollup_dal import MetricRollupDAL
+from helpers.config import (
+    ARCHIVE_ENABLED, ARCHIVE_PATH, ARCHIVE_RETENTION_DAYS, DEVICE_SERVICE_URL, LATEST_CACHE_ENABLED, REDIS_URL, ROLLUP_ENABLED,
+    ROLLUP_RETENTION_DAYS
+)
+from helpers.latest_cache import LatestValueCache
+from prometheus_client import Counter
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional
+import asyncio
+import csv
+import httpx
+import io
+import json
 import os
+import re
+from urllib.parse import quote
 from jose import jwt
 from helpers.logger import logger
 from dto.metric_dto import MetricDTO
@@ -14,21 +35,135 @@ http_bearer = HTTPBearer()
 MONGO_URI = os.getenv("MONGODB_URL", os.getenv("MONGO_URI", "mongodb://monitoring-mongo:27017"))
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8000")
 JWT_SECRET = os.getenv("JWT_SECRET", "changeme")
+METRIC_STORAGE_MODE = os.getenv("METRIC_STORAGE_MODE", "document")
 
+# Client synchrone : création des index au démarrage (et lectures du mode bucket)
 mongo_client = MongoClient(MONGO_URI)
 db = mongo_client["device_monitoring"]
-metrics_col = db["metrics"]
-metric_dal = MetricDAL(metrics_col)
+metric_dal = create_metric_dal(db, METRIC_STORAGE_MODE)
+metrics_col = metric_dal.collection
 
-import requests
+# Client asyncio (Motor) : les routes async gardent des centaines de requêtes en vol par worker
+async_mongo_client = AsyncIOMotorClient(MONGO_URI)
+async_metric_dal = AsyncMetricDAL(metric_dal, async_mongo_client["device_monitoring"][metrics_col.name])
+archive = MetricArchive(ARCHIVE_PATH) if ARCHIVE_ENABLED else None
+raw_retention_seconds = ARCHIVE_RETENTION_DAYS * 86400 if archive else RETENTION_SECONDS
+rollup_dal = MetricRollupDAL(db, ROLLUP_RETENTION_DAYS, raw_retention_seconds=raw_retention_seconds) if ROLLUP_ENABLED else None
+latest_cache = LatestValueCache(REDIS_URL) if LATEST_CACHE_ENABLED else None
 
-def check_token(token: HTTPAuthorizationCredentials = Depends(http_bearer)):
-    """Vérifier le token via le microservice d'Auth (qui consulte Redis)"""
+# Compteurs exposés sur /metrics (Prometheus)
+LATEST_CACHE_HITS = Counter("latest_metric_cache_hits_total", "Lectures /metrics/latest servies par le cache Redis")
+LATEST_CACHE_MISSES = Counter("latest_metric_cache_misses_total", "Lectures /metrics/latest servies par MongoDB")
+
+async def get_latest_cached(device_id: str):
+    """Cache Redis d'abord, repli sur MongoDB en cas de miss ou d'indisponibilité du cache"""
+    if latest_cache:
+        try:
+            metric = await latest_cache.aget(device_id)
+            if metric:
+                LATEST_CACHE_HITS.inc()
+                return metric
+        except Exception as e:
+            logger.warning('Latest Cache - Unavailable - Device: %s - Error: %s', device_id, str(e))
+        LATEST_CACHE_MISSES.inc()
+    return await async_metric_dal.get_latest(device_id)
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    """Le corps reste une liste (compatibilité) : le curseur de la page suivante passe par un en-tête"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+MAX_RAW_POINTS = 10000
+
+async def get_raw_range(device_id: str, start: datetime, end: datetime, metric_type: Optional[str],
+                        owner_id: Optional[int]) -> List[dict]:
+    """Mesures brutes sur [start, end] : archive Parquet avant la fenêtre chaude, MongoDB ensuite"""
+    data = []
+    start, end = naive_utc(start), naive_utc(end)
+    hot_start = hot_window_start(datetime.utcnow())
+    if archive and start < hot_start:
+        archived = await asyncio.to_thread(
+            archive.read_range, device_id, start, min(end, hot_start - timedelta(milliseconds=1)), owner_id, metric_type
+        )
+        data += [{"metric_type": m["metric_type"], "timestamp": m["timestamp_dt"], "value": m["value"], "unit": m.get("unit")}
+                 for m in archived[:MAX_RAW_POINTS]]
+        start = hot_start
+    if start <= end and len(data) < MAX_RAW_POINTS:
+        data += [
+            {"metric_type": m["metric_type"], "timestamp": m["timestamp_dt"], "value": m["value"], "unit": m.get("unit")}
+            for m in await async_metric_dal.get_range(device_id, start, end, owner_id=owner_id, limit=MAX_RAW_POINTS - len(data))
+            if not metric_type or m["metric_type"] == metric_type
+        ]
+    return data
+
+# Taille maximale d'une page : au-delà, utiliser le curseur ou /export
+MAX_PAGE_LIMIT = 1000
+# Nombre maximal de device_id par /query ($in fusionné par l'index sans tri en mémoire)
+MAX_QUERY_DEVICES = 100
+
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+MAX_STATS_BUCKETS = 5000
+
+def parse_bucket(bucket: str) -> int:
+    """'30s', '15m', '1h', '1d' -> secondes"""
+    match = re.fullmatch(r"(\d+)([smhd])", bucket)
+    if not match or int(match.group(1)) == 0:
+        raise HTTPException(status_code=400, detail="bucket invalide (ex: 30s, 15m, 1h, 1d)")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = ["device_id", "owner_id", "metric_type", "value", "unit", "timestamp"]
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def _export_chunk(batch: List[dict], export_format: str) -> str:
+    """Un lot de mesures sérialisé d'un bloc : une écriture réseau par lot, pas par ligne"""
+    if export_format == "ndjson":
+        return "".join(json.dumps(m, default=_json_default) + "\n" for m in batch)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for m in batch:
+        value = m.get("value")
+        # Valeurs composées (ex. system) : JSON dans la cellule
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, default=_json_default)
+        writer.writerow([m.get("device_id"), m.get("owner_id"), m.get("metric_type"), value, m.get("unit"), m.get("timestamp")])
+    return buffer.getvalue()
+
+def _content_disposition(filename: str) -> str:
+    """device_id vient de l'URL : nom ASCII assaini (guillemets, CR/LF, ';' remplacés par '_') et nom exact en filename* (RFC 5987)"""
+    fallback = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+async def _export_stream(batches: AsyncIterator[List[dict]], export_format: str, device_id: str) -> AsyncIterator[str]:
+    count = 0
+    if export_format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
     try:
-        response = requests.post(
+        async for batch in batches:
+            count += len(batch)
+            yield _export_chunk(batch, export_format)
+    except Exception as e:
+        # Les en-têtes sont déjà partis : on ne peut que tronquer le flux
+        logger.error('Get Metrics - Export - Interrupted - Device: %s - Rows: %d - Error: %s', device_id, count, str(e))
+        raise
+    logger.info('Get Metrics - Export - Done - Device: %s - Format: %s - Rows: %d', device_id, export_format, count)
+
+# Client HTTP partagé (keep-alive) pour la vérification des tokens
+auth_client = httpx.AsyncClient(timeout=5)
+
+async def check_token(token: HTTPAuthorizationCredentials = Depends(http_bearer)):
+    return await verify_token(token.credentials)
+
+async def verify_token(token: str) -> dict:
+    """Vérifier le token via le microservice d'Auth (qui consulte Redis), aussi utilisé à la connexion Socket.io"""
+    try:
+        response = await auth_client.post(
             f"{AUTH_SERVICE_URL}/users/verify-token",
-            json={"token": token.credentials},
-            timeout=5
+            json={"token": token}
         )
         if response.status_code != 200:
             raise HTTPException(status_code=401, detail="Session expirée ou banni")
@@ -38,54 +173,160 @@ def check_token(token: HTTPAuthorizationCredentials = Depends(http_bearer)):
         logger.error(f"Erreur vérification token: {e}")
         raise HTTPException(status_code=401, detail="Service d'authentification injoignable")
 
+async def verify_device_access(token: str, device_id: str) -> bool:
+    """Propriété d'un device vérifiée auprès du registre (Device-Management) avec le token de l'utilisateur,
+    indépendamment des métriques reçues. Registre injoignable : accès refusé."""
+    try:
+        response = await auth_client.get(
+            f"{DEVICE_SERVICE_URL}/devices/by-device-id/{quote(device_id, safe='')}",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    except Exception as e:
+        logger.error(f"Erreur vérification device {device_id}: {e}")
+        return False
+    if response.status_code not in (200, 403, 404):
+        logger.error(f"Erreur vérification device {device_id}: HTTP {response.status_code}")
+    return response.status_code == 200
+
 @router.get("/device/{device_id}")
-def get_metrics_by_device(request: Request, device_id: str, skip: int = 0, limit: int = 50, token=Depends(check_token)):
+async def get_metrics_by_device(request: Request, response: Response, device_id: str, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=MAX_PAGE_LIMIT),
+                          cursor: Optional[str] = None, token=Depends(check_token)):
     """Seul l'admin ou le propriétaire du device peut voir ces métriques"""
     is_admin = token.get("is_admin", False)
     user_id = token.get("id")
 
     logger.info('Get Metrics - Device - ID: %s - User: %s - IP: %s', device_id, token.get('sub'), request.client.host)
     try:
-        # Récupération de la première métrique pour trouver l'owner (ou via management si on veut être strict)
-        # Approche simple : On filtre directement par owner_id si on n'est pas admin
-        query = {"device_id": device_id}
-        if not is_admin:
-            query["owner_id"] = user_id
-            
-        # Utilisation de la méthode spécifique DAL avec pagination
-        if is_admin:
-            # Si admin, on veut tout pour ce device
-            metrics = metric_dal.get_by_device(device_id, skip, limit)
-        else:
-            # Si user, on filtre aussi par owner (implémenté dans le DAL ?)
-            # Le DAL actuel get_by_device ne filtre pas par owner, donc on doit faire attention
-            # Soit on modifie le DAL, soit on filtre ici. 
-            # Comme on a ajouté le filtrage dans le code original avec query["owner_id"] = user_id
-            # On va adapter l'appel direct à mongo ici pour la pagination custom sécurisée
-            # OU MIEUX: on utilise le DAL si on lui fait confiance, mais ici le DAL get_by_device est simple.
-            # Pour rester cohérent avec le DAL modifié:
-            metrics = metric_dal.get_by_device(device_id, skip, limit)
-            # MAIS ATTENTION: get_by_device ne vérifie pas l'owner_id dans le DAL modifié ci-dessus.
-            # Sécurité: Si on est pas admin, on doit vérifier que le device appartient au user.
-            # On va récupérer le latest pour vérifier l'owner, ou faire une query custom.
-            
-            # Approche sure: Ré-implémenter la query avec pagination ici pour respecter la logique de sécurité précédente
-            # ou ajouter check_owner au DAL.
-            # Vu le code précédent, il faisait metric_dal.collection.find(query)
-            
-            cursor = metric_dal.collection.find(query, {"_id": 0}).sort("timestamp_dt", -1).skip(skip).limit(limit)
-            metrics = list(cursor)
+        # Un utilisateur ne voit que ses propres métriques : filtrage par owner dans le DAL
+        if not is_admin and user_id is None:
+            return []
+        owner_filter = None if is_admin else user_id
+        metrics, next_cursor = await async_metric_dal.page_by_device(device_id, limit, cursor, skip, owner_id=owner_filter)
+        set_next_cursor(response, next_cursor)
         
         if not metrics and not is_admin:
              return []
             
         return metrics
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
     except Exception as e:
         logger.error('Get Metrics - Device - Failed - Device: %s - IP: %s - Error: %s', device_id, request.client.host, str(e))
         raise HTTPException(status_code=500, detail="Erreur récupération métriques")
 
+@router.get("/device/{device_id}/history")
+async def get_device_history(
+    request: Request,
+    device_id: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    metric_type: Optional[str] = None,
+    points: int = Query(100, ge=1, le=10000),
+    token=Depends(check_token)
+):
+    """Historique d'un device sur [from, to] : le niveau (raw, 1m, 1h, 1d) le plus grossier donnant au moins `points` points"""
+    is_admin = token.get("is_admin", False)
+    user_id = token.get("id")
+    if not is_admin and user_id is None:
+        return {"tier": "raw", "points": []}
+
+    end = naive_utc(end) or datetime.utcnow()
+    start = naive_utc(start) or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' doit précéder 'to'")
+    owner_filter = None if is_admin else user_id
+
+    try:
+        tier = rollup_dal.choose_tier(start, end, points) if rollup_dal else "raw"
+        if tier == "raw":
+            data = await get_raw_range(device_id, start, end, metric_type, owner_filter)
+        else:
+            data = await asyncio.to_thread(rollup_dal.get_range, tier, device_id, start, end, metric_type, owner_filter)
+        logger.info('Get Metrics - History - Device: %s - Tier: %s - Count: %d - User: %s - IP: %s', device_id, tier, len(data), token.get('sub'), request.client.host)
+        return {"device_id": device_id, "from": start, "to": end, "tier": tier, "points": data}
+    except Exception as e:
+        logger.error('Get Metrics - History - Failed - Device: %s - IP: %s - Error: %s', device_id, request.client.host, str(e))
+        raise HTTPException(status_code=500, detail="Erreur récupération historique")
+
+@router.get("/device/{device_id}/export")
+async def export_device_metrics(
+    request: Request,
+    device_id: str,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    token=Depends(check_token)
+):
+    """Export des mesures brutes de [from, to] (défaut : toute la rétention) en streaming.
+    Le curseur MongoDB est lu par lots : mémoire constante et premier octet immédiat quel que soit le volume."""
+    is_admin = token.get("is_admin", False)
+    user_id = token.get("id")
+    if not is_admin and user_id is None:
+        raise HTTPException(status_code=403, detail="Accès non autorisé à ce device")
+
+    end = naive_utc(end) or datetime.utcnow()
+    start = naive_utc(start) or end - timedelta(seconds=RETENTION_SECONDS)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' doit précéder 'to'")
+    owner_filter = None if is_admin else user_id
+
+    logger.info('Get Metrics - Export - Device: %s - Format: %s - User: %s - IP: %s', device_id, export_format, token.get('sub'), request.client.host)
+    batches = async_metric_dal.iter_range(device_id, start, end, owner_id=owner_filter)
+    filename = f"metrics_{device_id}_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}.{export_format}"
+    return StreamingResponse(
+        _export_stream(batches, export_format, device_id),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={
+            "Content-Disposition": _content_disposition(filename),
+            # Pas de mise en tampon par un reverse proxy (nginx / ingress)
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+@router.get("/device/{device_id}/stats")
+async def get_device_stats(
+    request: Request,
+    device_id: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: str = "1h",
+    p: str = "50,95,99",
+    field: Optional[str] = Query(None, pattern=r"^[A-Za-z0-9_]+$"),
+    token=Depends(check_token)
+):
+    """Statistiques par bucket (min, max, avg, count, percentiles) calculées côté MongoDB.
+    `field` cible un sous-champ des valeurs composées (ex: cpu_percent pour un device system)."""
+    is_admin = token.get("is_admin", False)
+    user_id = token.get("id")
+    if not is_admin and user_id is None:
+        return {"device_id": device_id, "buckets": []}
+
+    end = naive_utc(end) or datetime.utcnow()
+    start = naive_utc(start) or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' doit précéder 'to'")
+    bucket_seconds = parse_bucket(bucket)
+    if (end - start).total_seconds() / bucket_seconds > MAX_STATS_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Trop de buckets (max {MAX_STATS_BUCKETS}), augmentez 'bucket'")
+    try:
+        percentiles = [float(v) / 100 for v in p.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="p invalide (ex: 50,95,99)")
+    if any(not 0 < v <= 1 for v in percentiles):
+        raise HTTPException(status_code=400, detail="Les percentiles doivent être dans ]0, 100]")
+
+    try:
+        owner_filter = None if is_admin else user_id
+        stats = await async_metric_dal.get_stats(device_id, start, end, bucket_seconds, percentiles, field=field, owner_id=owner_filter)
+        logger.info('Get Metrics - Stats - Device: %s - Bucket: %s - Count: %d - User: %s - IP: %s', device_id, bucket, len(stats), token.get('sub'), request.client.host)
+        return {"device_id": device_id, "from": start, "to": end, "bucket": bucket, "field": field, "buckets": stats}
+    except Exception as e:
+        logger.error('Get Metrics - Stats - Failed - Device: %s - IP: %s - Error: %s', device_id, request.client.host, str(e))
+        raise HTTPException(status_code=500, detail="Erreur calcul statistiques")
+
 @router.get("/owner/{owner_id}")
-def get_metrics_by_owner(request: Request, owner_id: int, skip: int = 0, limit: int = 50, token=Depends(check_token)):
+async def get_metrics_by_owner(request: Request, response: Response, owner_id: int, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=MAX_PAGE_LIMIT),
+                         cursor: Optional[str] = None, token=Depends(check_token)):
     """Seul l'admin ou le propriétaire peut voir ces métriques"""
     is_admin = token.get("is_admin", False)
     user_id = token.get("id")
@@ -96,31 +337,84 @@ def get_metrics_by_owner(request: Request, owner_id: int, skip: int = 0, limit:
     
     logger.info('Get Metrics - Owner - Success - Target: %s - User: %s - IP: %s', owner_id, token.get('sub'), request.client.host)
     try:
-        metrics = metric_dal.get_by_owner(owner_id, skip, limit)
+        metrics, next_cursor = await async_metric_dal.page_by_owner(owner_id, limit, cursor, skip)
+        set_next_cursor(response, next_cursor)
         return metrics
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
     except Exception as e:
         logger.error('Get Metrics - Owner - Failed - Target: %s - IP: %s - Error: %s', owner_id, request.client.host, str(e))
         raise HTTPException(status_code=500, detail="Erreur récupération métriques")
 
 @router.get("/type/{metric_type}")
-def get_metrics_by_type(request: Request, metric_type: str, skip: int = 0, limit: int = 50, token=Depends(check_token)):
+async def get_metrics_by_type(request: Request, response: Response, metric_type: str, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=MAX_PAGE_LIMIT),
+                        cursor: Optional[str] = None, token=Depends(check_token)):
     logger.info('Get Metrics - Type - Request - Type: %s - User: %s - IP: %s', metric_type, token.get('sub'), request.client.host)
     try:
-        metrics = metric_dal.get_by_type(metric_type, skip, limit)
+        metrics, next_cursor = await async_metric_dal.page_by_type(metric_type, limit, cursor, skip)
+        set_next_cursor(response, next_cursor)
         logger.info('Get Metrics - Type - Success - Type: %s - Count: %d - IP: %s', metric_type, len(metrics), request.client.host)
         return metrics
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
     except Exception as e:
         logger.error('Get Metrics - Type - Failed - Type: %s - IP: %s - Error: %s', metric_type, request.client.host, str(e))
         raise HTTPException(status_code=500, detail="Erreur lors de la récupération des métriques")
 
+@router.get("/query")
+async def query_metrics(
+    request: Request,
+    response: Response,
+    device_id: Optional[List[str]] = Query(None),
+    owner_id: Optional[int] = None,
+    metric_type: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    token=Depends(check_token)
+):
+    """Mesures de [from, to] (défaut : dernière heure) filtrées par device_id (répétable), owner_id et metric_type.
+    Un utilisateur non admin est toujours restreint à ses propres devices."""
+    is_admin = token.get("is_admin", False)
+    user_id = token.get("id")
+    if not is_admin:
+        if user_id is None:
+            return []
+        if owner_id is not None and owner_id != user_id:
+            logger.warning('Query Metrics - Access Denied - Target: %s - User: %s - IP: %s', owner_id, token.get('sub'), request.client.host)
+            raise HTTPException(status_code=403, detail="Accès non autorisé aux données d'un tiers")
+        owner_id = user_id
+    if not (device_id or owner_id is not None or metric_type):
+        raise HTTPException(status_code=400, detail="Au moins un filtre requis (device_id, owner_id ou metric_type)")
+    if device_id and len(device_id) > MAX_QUERY_DEVICES:
+        raise HTTPException(status_code=400, detail=f"Trop de device_id (max {MAX_QUERY_DEVICES})")
+
+    end = naive_utc(end) or datetime.utcnow()
+    start = naive_utc(start) or end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' doit précéder 'to'")
+
+    try:
+        metrics, next_cursor = await async_metric_dal.page_by_filters(start, end, device_id, owner_id, metric_type, limit, cursor)
+        set_next_cursor(response, next_cursor)
+        logger.info('Query Metrics - Success - Devices: %s - Owner: %s - Type: %s - Count: %d - User: %s - IP: %s',
+                    device_id, owner_id, metric_type, len(metrics), token.get('sub'), request.client.host)
+        return metrics
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    except Exception as e:
+        logger.error('Query Metrics - Failed - IP: %s - Error: %s', request.client.host, str(e))
+        raise HTTPException(status_code=500, detail="Erreur lors de la récupération des métriques")
+
 @router.get("/latest/{device_id}")
-def get_latest_metric(request: Request, device_id: str, token=Depends(check_token)):
+async def get_latest_metric(request: Request, device_id: str, token=Depends(check_token)):
     """Dernière valeur d'un device (avec vérification owner)"""
     is_admin = token.get("is_admin", False)
     user_id = token.get("id")
 
     try:
-        metric = metric_dal.get_latest(device_id)
+        metric = await get_latest_cached(device_id)
         if not metric:
             raise HTTPException(status_code=404, detail="Pas de données pour ce device")
             
@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, List
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+from helpers.logger import logger
+
+# Options comparées entre l'index existant et l'index déclaré (hors TTL, modifiable sans reconstruction)
+_STRUCTURAL_OPTIONS = ("unique", "sparse", "partialFilterExpression")
+_INDEX_NOT_FOUND = 27
+
+def _key(spec) -> List[tuple]:
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in (spec.items() if hasattr(spec, "items") else spec)]
+
+def reconcile_indexes(collection: Collection, declared: List[IndexModel], legacy: Iterable[str] = ()) -> Dict[str, List[str]]:
+    """Aligne les index de la collection sur la liste déclarée par le DAL (idempotent).
+
+    Crée les index manquants, reconstruit ceux dont la clé ou les options ont changé, met à jour le
+    TTL par collMod et supprime les anciens index listés dans legacy. Les autres index non déclarés
+    (ajoutés par un opérateur, index créés par MongoDB sur une collection time-series...) sont conservés
+    et signalés dans le log. Plusieurs réplicas peuvent l'exécuter en même temps au démarrage : un index
+    déjà supprimé par un autre est ignoré.
+    """
+    existing = collection.index_information()
+    wanted = {model.document["name"]: model for model in declared}
+    legacy = set(legacy)
+    report: Dict[str, List[str]] = {"created": [], "rebuilt": [], "ttl": [], "dropped": [], "unmanaged": []}
+
+    def drop(name: str):
+        try:
+            collection.drop_index(name)
+        except OperationFailure as e:
+            if e.code != _INDEX_NOT_FOUND:
+                raise
+
+    for name in existing:
+        if name == "_id_" or name in wanted:
+            continue
+        if name in legacy:
+            drop(name)
+            report["dropped"].append(name)
+        else:
+            report["unmanaged"].append(name)
+
+    to_create = []
+    for name, model in wanted.items():
+        spec = model.document
+        current = existing.get(name)
+        if current is None:
+            to_create.append(model)
+            report["created"].append(name)
+        elif _key(current["key"]) != _key(spec["key"]) or any(
+                current.get(option) != spec.get(option) for option in _STRUCTURAL_OPTIONS) or (
+                ("expireAfterSeconds" in current) != ("expireAfterSeconds" in spec)):
+            drop(name)
+            to_create.append(model)
+            report["rebuilt"].append(name)
+        elif current.get("expireAfterSeconds") != spec.get("expireAfterSeconds"):
+            collection.database.command("collMod", collection.name, index={
+                "name": name, "expireAfterSeconds": spec["expireAfterSeconds"]})
+            report["ttl"].append(name)
+    if to_create:
+        collection.create_indexes(to_create)
+
+    if report["unmanaged"]:
+        logger.warning("[MongoDB] Index non déclarés conservés sur %s: %s", collection.name, report["unmanaged"])
+    changes = {action: names for action, names in report.items() if names and action != "unmanaged"}
+    if changes:
+        logger.info("[MongoDB] Index %s réconciliés: %s", collection.name, changes)
+    return report
@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dal.metric_dal import RETENTION_SECONDS, naive_utc
+from helpers.logger import logger
+
+SCHEMA = pa.schema([
+    ("device_id", pa.string()),
+    ("metric_type", pa.string()),
+    ("timestamp_dt", pa.timestamp("ms")),
+    ("timestamp", pa.string()),
+    # Valeur numérique en colonne typée, valeurs composées (ex. system) sérialisées en JSON
+    ("value", pa.float64()),
+    ("value_json", pa.string()),
+    ("unit", pa.string()),
+])
+# Colonnes lues pour l'historique : timestamp (chaîne d'origine) n'est lu que par l'export complet
+HISTORY_COLUMNS = ["metric_type", "timestamp_dt", "value", "value_json", "unit"]
+ROW_GROUP_SIZE = 65536
+DONE_MARKER = "_SUCCESS"
+
+def hot_window_start(now: datetime) -> datetime:
+    """Premier jour entier encore présent dans MongoDB : les jours antérieurs sont lus dans l'archive"""
+    return (now - timedelta(seconds=RETENTION_SECONDS)).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+class MetricArchive:
+    """Archive froide des mesures brutes en Parquet (zstd), une partition par jour et par owner :
+    <path>/date=YYYY-MM-DD/owner_id=<id>/metrics.parquet
+
+    Chaque fichier est trié par (device_id, timestamp_dt) (ordre de lecture de MongoDB) : les statistiques min/max des row groups
+    permettent de ne décompresser que les row groups du device demandé, et seules les colonnes
+    utiles sont lues (fichier projeté en mémoire).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _day_dir(self, day: date) -> str:
+        return os.path.join(self.path, f"date={day.isoformat()}")
+
+    def is_archived(self, day: date) -> bool:
+        return os.path.exists(os.path.join(self._day_dir(day), DONE_MARKER))
+
+    def archived_days(self) -> List[date]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            date.fromisoformat(name[len("date="):]) for name in os.listdir(self.path)
+            if name.startswith("date=") and os.path.exists(os.path.join(self.path, name, DONE_MARKER))
+        )
+
+    @staticmethod
+    def _row(document: dict) -> dict:
+        value = document.get("value")
+        numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+        return {
+            "device_id": document["device_id"],
+            "metric_type": document.get("metric_type"),
+            "timestamp_dt": document["timestamp_dt"],
+            "timestamp": str(document.get("timestamp")),
+            "value": float(value) if numeric else None,
+            "value_json": None if numeric else json.dumps(value, default=str),
+            "unit": document.get("unit"),
+        }
+
+    def write_day(self, day: date, documents: Iterable[dict]) -> Dict[Optional[int], int]:
+        """Écrit la journée (documents au format MetricDAL._output) et renvoie le nombre de lignes par owner.
+
+        Les documents doivent arriver triés par (owner_id, device_id, timestamp_dt) (MetricDAL.iter_period) :
+        chaque owner est écrit en flux par un ParquetWriter, un row group à la fois, la mémoire ne dépend
+        pas du volume de la journée. La partition est écrite dans un répertoire temporaire puis renommée :
+        un lecteur ne voit jamais une journée partielle, et une journée déjà archivée est réécrite à l'identique.
+        """
+        final_dir = self._day_dir(day)
+        tmp_dir = final_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        counts: Dict[Optional[int], int] = {}
+        writer: Optional[pq.ParquetWriter] = None
+        owner_id = None
+        rows: List[dict] = []
+
+        def flush():
+            if rows:
+                writer.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), row_group_size=ROW_GROUP_SIZE)
+                rows.clear()
+
+        try:
+            for document in documents:
+                document_owner = document.get("owner_id")
+                if writer is None or document_owner != owner_id:
+                    if writer is not None:
+                        flush()
+                        writer.close()
+                    if document_owner in counts:
+                        raise ValueError(f"Documents non triés par owner_id ({document_owner} déjà écrit)")
+                    owner_id = document_owner
+                    counts[owner_id] = 0
+                    owner_dir = os.path.join(tmp_dir, f"owner_id={owner_id}")
+                    os.makedirs(owner_dir)
+                    writer = pq.ParquetWriter(os.path.join(owner_dir, "metrics.parquet"), SCHEMA,
+                                              compression="zstd", write_statistics=True)
+                rows.append(self._row(document))
+                counts[owner_id] += 1
+                if len(rows) >= ROW_GROUP_SIZE:
+                    flush()
+            if writer is not None:
+                flush()
+                writer.close()
+                writer = None
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        open(os.path.join(tmp_dir, DONE_MARKER), "w").close()
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+        return counts
+
+    def _files(self, day: date, owner_id: Optional[int]) -> List[str]:
+        day_dir = self._day_dir(day)
+        if not os.path.exists(os.path.join(day_dir, DONE_MARKER)):
+            return []
+        owners = [f"owner_id={owner_id}"] if owner_id is not None else [
+            name for name in os.listdir(day_dir) if name.startswith("owner_id=")
+        ]
+        paths = [os.path.join(day_dir, owner, "metrics.parquet") for owner in owners]
+        return [p for p in paths if os.path.exists(p)]
+
+    def read_range(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int] = None,
+                   metric_type: Optional[str] = None, columns: List[str] = HISTORY_COLUMNS) -> List[dict]:
+        """Mesures d'un device sur [start, end] par date croissante.
+
+        Élagage par partition (jours, owner), par row group (filtre device_id/timestamp_dt poussé dans
+        le lecteur Parquet) puis par colonne : un mois pour un device ne lit que ces colonnes-là.
+        """
+        # timestamp_dt est un timestamp sans fuseau : comparer une borne avec fuseau échoue dans pyarrow
+        start, end = naive_utc(start), naive_utc(end)
+        filters = [("device_id", "=", device_id), ("timestamp_dt", ">=", start), ("timestamp_dt", "<=", end)]
+        if metric_type:
+            filters.append(("metric_type", "=", metric_type))
+        tables = []
+        day = start.date()
+        while day <= end.date():
+            for path in self._files(day, owner_id):
+                tables.append(pq.read_table(path, columns=columns, filters=filters, memory_map=True))
+            day += timedelta(days=1)
+        if not tables:
+            return []
+        table = pa.concat_tables(tables)
+        table = table.take(pc.sort_indices(table, [("timestamp_dt", "ascending")]))
+        readings = []
+        for row in table.to_pylist():
+            value_json = row.pop("value_json", None)
+            if value_json is not None:
+                row["value"] = json.loads(value_json)
+            readings.append(row)
+        return readings
+
+    def prune(self, before: date) -> List[date]:
+        """Supprime les journées antérieures à before (rétention de l'archive)"""
+        removed = [day for day in self.archived_days() if day < before]
+        for day in removed:
+            shutil.rmtree(self._day_dir(day), ignore_errors=True)
+        if removed:
+            logger.info("[Archive] %d journées supprimées (avant %s)", len(removed), before)
+        return removed
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorCollection
+from dal.metric_dal import EXPORT_BATCH_SIZE, MetricDAL, PAGE_SORT
+
+class AsyncMetricDAL:
+    """Variante asyncio (Motor) des lectures de MetricDAL, pour les routes async de l'API.
+
+    Les requêtes sont construites par le DAL synchrone (même mode de stockage, mêmes index) et exécutées
+    sur le client Motor : une requête en attente n'occupe plus de thread du threadpool. Les modes dont
+    la lecture n'est pas exprimable en requête simple (bucket) sont exécutés dans un thread.
+    """
+
+    def __init__(self, dal: MetricDAL, collection: AsyncIOMotorCollection):
+        self.dal = dal
+        self.collection = collection
+
+    async def _find_page(self, query: dict, limit: int, cursor: Optional[str], skip: int) -> Tuple[List[dict], Optional[str]]:
+        query = self.dal._keyset_query(query, cursor)
+        documents = await self.collection.find(query).sort(PAGE_SORT).skip(skip).limit(limit).to_list(length=limit or None)
+        return self.dal._page_result(documents, limit)
+
+    async def page_by_device(self, device_id: str, limit: int = 50, cursor: Optional[str] = None, skip: int = 0,
+                             owner_id: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+        if not self.dal.supports_async:
+            return await asyncio.to_thread(self.dal.page_by_device, device_id, limit, cursor, skip, owner_id)
+        return await self._find_page(self.dal._query(owner_id, device_id=device_id), limit, cursor, skip)
+
+    async def page_by_owner(self, owner_id: int, limit: int = 50, cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[dict], Optional[str]]:
+        if not self.dal.supports_async:
+            return await asyncio.to_thread(self.dal.page_by_owner, owner_id, limit, cursor, skip)
+        return await self._find_page(self.dal._query(owner_id), limit, cursor, skip)
+
+    async def page_by_type(self, metric_type: str, limit: int = 50, cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[dict], Optional[str]]:
+        if not self.dal.supports_async:
+            return await asyncio.to_thread(self.dal.page_by_type, metric_type, limit, cursor, skip)
+        return await self._find_page(self.dal._query(metric_type=metric_type), limit, cursor, skip)
+
+    async def page_by_filters(self, start: datetime, end: datetime, device_ids: Optional[List[str]] = None,
+                              owner_id: Optional[int] = None, metric_type: Optional[str] = None, limit: int = 50,
+                              cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        if not self.dal.supports_async:
+            return await asyncio.to_thread(self.dal.page_by_filters, start, end, device_ids, owner_id, metric_type, limit, cursor)
+        query = self.dal._filter_query(start, end, device_ids, owner_id, metric_type)
+        return await self._find_page(query, limit, cursor, 0)
+
+    async def get_latest(self, device_id: str) -> Optional[dict]:
+        if not self.dal.supports_async:
+            return await asyncio.to_thread(self.dal.get_latest, device_id)
+        document = await self.collection.find_one(self.dal._query(device_id=device_id), sort=[("timestamp_dt", -1)])
+        return self.dal._output(document) if document else None
+
+    async def get_range(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int] = None, limit: int = 10000) -> List[dict]:
+        if not self.dal.supports_async:
+            return await asyncio.to_thread(self.dal.get_range, device_id, start, end, owner_id, limit)
+        query = self.dal._range_query(device_id, start, end, owner_id)
+        documents = await self.collection.find(query).sort("timestamp_dt", 1).limit(limit).to_list(length=limit)
+        return [self.dal._output(d) for d in documents]
+
+    async def iter_range(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int] = None,
+                         batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+        """Mesures de [start, end] par date croissante, par lots de batch_size (export en streaming)"""
+        if not self.dal.supports_async:
+            iterator = self.dal.iter_range(device_id, start, end, owner_id, batch_size)
+            while batch := await asyncio.to_thread(lambda: list(islice(iterator, batch_size))):
+                yield batch
+            return
+        query = self.dal._range_query(device_id, start, end, owner_id)
+        cursor = self.collection.find(query).sort("timestamp_dt", 1).batch_size(batch_size)
+        batch = []
+        async for document in cursor:
+            batch.append(self.dal._output(document))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def get_stats(self, device_id: str, start: datetime, end: datetime, bucket_seconds: int,
+                        percentiles: List[float], field: Optional[str] = None, owner_id: Optional[int] = None) -> List[dict]:
+        # Détection de version mise en cache après le premier appel
+        native_percentile = bool(percentiles) and await asyncio.to_thread(self.dal._supports_percentile)
+        sample_rate = 1.0
+        if percentiles and not native_percentile:
+            counted = await self.collection.aggregate(
+                self.dal._stats_count_pipeline(device_id, start, end, field, owner_id), allowDiskUse=True).to_list(length=1)
+            sample_rate = self.dal._sample_rate(counted)
+        pipeline = self.dal._stats_pipeline(device_id, start, end, bucket_seconds, percentiles, native_percentile, field,
+                                            owner_id, sample_rate)
+        rows = await self.collection.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+        return [self.dal._stats_row(row, percentiles, native_percentile) for row in rows]
@@ -0,0 +1,227 @@
+import base64
+import json
+from itertools import groupby, islice
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from pymongo import IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+from dal.metric_dal import EXPORT_BATCH_SIZE, MetricDAL, RETENTION_SECONDS
+
+BUCKET_SECONDS = 3600
+
+class BucketMetricDAL(MetricDAL):
+    """Stockage "bucket" : un document par device, type et heure contenant le tableau des mesures.
+
+    device_id, owner_id, metric_type et unit ne sont stockés qu'une fois par bucket et les index
+    secondaires ne sont mis à jour qu'à la création du bucket, pas à chaque mesure.
+    """
+
+    # Lecture par regroupement des buckets en Python : AsyncMetricDAL délègue à un thread
+    supports_async = False
+
+    INDEXES = [
+        # TTL sur le début du bucket : on garde l'heure entamée en plus de la rétention
+        IndexModel("hour", expireAfterSeconds=RETENTION_SECONDS + BUCKET_SECONDS),
+        # Clé d'upsert du bucket, sert aussi aux lectures par device triées par date
+        IndexModel([("device_id", 1), ("hour", -1), ("metric_type", 1)], unique=True),
+        IndexModel([("owner_id", 1), ("hour", -1)]),
+        IndexModel([("metric_type", 1), ("hour", -1)]),
+    ]
+
+    @staticmethod
+    def _bucket_key(document: dict) -> Tuple[str, str, object]:
+        ts = document["timestamp_dt"]
+        return document["device_id"], document["metric_type"], ts.replace(minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def _reading(document: dict) -> dict:
+        return {"t": document["timestamp_dt"], "ts": document["timestamp"], "v": document["value"]}
+
+    def _upsert_spec(self, key: Tuple[str, str, object], documents: List[dict]) -> Tuple[dict, dict]:
+        device_id, metric_type, hour = key
+        first = documents[0]
+        return (
+            {"device_id": device_id, "metric_type": metric_type, "hour": hour},
+            {
+                "$push": {"readings": {"$each": [self._reading(d) for d in documents]}},
+                "$inc": {"count": len(documents)},
+                "$set": {"owner_id": first["owner_id"], "unit": first["unit"]},
+            }
+        )
+
+    def insert_document(self, document: dict):
+        query, update = self._upsert_spec(self._bucket_key(document), [document])
+        self.collection.update_one(query, update, upsert=True)
+
+    def write_documents(self, documents: List[dict]) -> List[dict]:
+        """Un seul bulk_write : un upsert par bucket touché par le lot"""
+        if not documents:
+            return []
+        buckets: Dict[Tuple[str, str, object], List[dict]] = {}
+        for document in documents:
+            buckets.setdefault(self._bucket_key(document), []).append(document)
+        try:
+            ops = [UpdateOne(*self._upsert_spec(key, docs), upsert=True) for key, docs in buckets.items()]
+            self.collection.bulk_write(ops, ordered=False)
+            return documents
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            return [document for i, docs in enumerate(buckets.values()) if i not in failed for document in docs]
+
+    @staticmethod
+    def _flatten(bucket: dict) -> List[dict]:
+        """Reconstitue les mesures d'un bucket au format du stockage "document", plus récentes d'abord"""
+        return [
+            {
+                "device_id": bucket["device_id"],
+                "owner_id": bucket.get("owner_id"),
+                "metric_type": bucket["metric_type"],
+                "value": r["v"],
+                "unit": bucket.get("unit"),
+                "timestamp": r["ts"],
+                "timestamp_dt": r["t"],
+            }
+            for r in sorted(bucket.get("readings", []), key=lambda r: r["t"], reverse=True)
+        ]
+
+    def _iter_readings(self, query: dict) -> Iterator[dict]:
+        """Parcourt les mesures par date décroissante, une heure de buckets à la fois"""
+        cursor = self.collection.find(query, {"_id": 0}).sort("hour", -1)
+        for _, hour_buckets in groupby(cursor, key=lambda b: b["hour"]):
+            readings = [r for bucket in hour_buckets for r in self._flatten(bucket)]
+            readings.sort(key=lambda r: r["timestamp_dt"], reverse=True)
+            yield from readings
+
+    @staticmethod
+    def _encode_cursor(last_dt: datetime, seen: int) -> str:
+        raw = json.dumps({"t": last_dt.isoformat(), "n": seen}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            return datetime.fromisoformat(raw["t"]), int(raw["n"])
+        except Exception as e:
+            raise ValueError(f"Curseur invalide: {cursor}") from e
+
+    def _find_page(self, query: dict, limit: int, cursor: Optional[str] = None, skip: int = 0,
+                   time_range: Optional[Tuple[datetime, datetime]] = None) -> Tuple[List[dict], Optional[str]]:
+        """Les mesures n'ont pas d'_id : le curseur porte le dernier timestamp_dt servi et le nombre
+        de mesures déjà servies à cet instant exact. Les buckets plus récents sont exclus par l'index.
+        time_range écarte les mesures hors intervalle des buckets de bord."""
+        last_dt, seen = None, 0
+        if cursor:
+            last_dt, seen = self._decode_cursor(cursor)
+            query = {"$and": [query, {"hour": {"$lte": last_dt.replace(minute=0, second=0, microsecond=0)}}]}
+        readings = self._iter_readings(query)
+        if time_range:
+            start, end = time_range
+            readings = (r for r in readings if start <= r["timestamp_dt"] <= end)
+        if last_dt is not None:
+            readings = self._after(readings, last_dt, seen)
+        page = list(islice(readings, skip, skip + limit))
+        next_cursor = None
+        if limit and len(page) == limit:
+            tail_dt = page[-1]["timestamp_dt"]
+            if tail_dt == last_dt:
+                # Toute la page (et le skip) est au même instant que le curseur précédent
+                tail_seen = seen + skip + len(page)
+            else:
+                tail_seen = sum(1 for r in page if r["timestamp_dt"] == tail_dt)
+            next_cursor = self._encode_cursor(tail_dt, tail_seen)
+        return page, next_cursor
+
+    @staticmethod
+    def _after(readings: Iterator[dict], last_dt: datetime, seen: int) -> Iterator[dict]:
+        for reading in readings:
+            if reading["timestamp_dt"] > last_dt:
+                continue
+            if reading["timestamp_dt"] == last_dt and seen > 0:
+                seen -= 1
+                continue
+            yield reading
+
+    def _filter_query(self, start: datetime, end: datetime, device_ids: Optional[List[str]],
+                      owner_id: Optional[int], metric_type: Optional[str]) -> dict:
+        query = {"hour": {"$gte": start.replace(minute=0, second=0, microsecond=0), "$lte": end}}
+        if device_ids:
+            query["device_id"] = device_ids[0] if len(device_ids) == 1 else {"$in": device_ids}
+        if owner_id is not None:
+            query["owner_id"] = owner_id
+        if metric_type:
+            query["metric_type"] = metric_type
+        return query
+
+    def page_by_filters(self, start: datetime, end: datetime, device_ids: Optional[List[str]] = None,
+                        owner_id: Optional[int] = None, metric_type: Optional[str] = None, limit: int = 50,
+                        cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        query = self._filter_query(start, end, device_ids, owner_id, metric_type)
+        return self._find_page(query, limit, cursor, time_range=(start, end))
+
+    def explain_queries(self, device_id: str, owner_id: int, metric_type: str) -> Dict[str, dict]:
+        now = datetime.utcnow()
+        start = now - timedelta(days=1)
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        shapes = {
+            "page_by_device": {"device_id": device_id},
+            "page_by_device (owner)": {"device_id": device_id, "owner_id": owner_id},
+            "page_by_owner": {"owner_id": owner_id},
+            "page_by_type": {"metric_type": metric_type},
+            "page_by_filters (devices)": self._filter_query(start, now, [device_id, f"{device_id}-2"], owner_id, None),
+            "page_by_filters (owner, type)": self._filter_query(start, now, None, owner_id, metric_type),
+            "page_by_filters (type)": self._filter_query(start, now, None, None, metric_type),
+        }
+        plans = {}
+        for name, query in shapes.items():
+            plans[name] = self._explain_find(query, [("hour", -1)])
+            plans[f"{name} (cursor)"] = self._explain_find({"$and": [query, {"hour": {"$lte": hour}}]}, [("hour", -1)])
+        range_query = {"device_id": device_id, "owner_id": owner_id, "hour": {"$gte": start, "$lte": now}}
+        plans["get_range"] = self.collection.find(range_query, {"_id": 0}).explain()
+        plans["get_stats"] = self._explain_aggregate(self._stats_pipeline(device_id, start, now, 3600, [], False, None, owner_id))
+        return plans
+
+    def get_latest(self, device_id: str) -> Optional[dict]:
+        return next(self._iter_readings({"device_id": device_id}), None)
+
+    def get_range(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int] = None, limit: int = 10000) -> List[dict]:
+        query = {"device_id": device_id, "hour": {"$gte": start.replace(minute=0, second=0, microsecond=0), "$lte": end}}
+        if owner_id is not None:
+            query["owner_id"] = owner_id
+        readings = [
+            r for bucket in self.collection.find(query, {"_id": 0})
+            for r in self._flatten(bucket) if start <= r["timestamp_dt"] <= end
+        ]
+        readings.sort(key=lambda r: r["timestamp_dt"])
+        return readings[:limit]
+
+    def iter_range(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int] = None,
+                   batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+        """Buckets lus par heure croissante : une heure de mesures en mémoire à la fois"""
+        query = {"device_id": device_id, "hour": {"$gte": start.replace(minute=0, second=0, microsecond=0), "$lte": end}}
+        if owner_id is not None:
+            query["owner_id"] = owner_id
+        cursor = self.collection.find(query, {"_id": 0}).sort("hour", 1).batch_size(max(1, batch_size // 100))
+        for _, hour_buckets in groupby(cursor, key=lambda b: b["hour"]):
+            readings = [r for bucket in hour_buckets for r in self._flatten(bucket) if start <= r["timestamp_dt"] <= end]
+            readings.sort(key=lambda r: r["timestamp_dt"])
+            yield from readings
+
+    def iter_period(self, start: datetime, end: datetime, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+        query = {"hour": {"$gte": start.replace(minute=0, second=0, microsecond=0), "$lt": end}}
+        # Même ordre que le stockage "document" : (owner, device, heure), mesures du bucket par date croissante
+        sort = [("owner_id", 1), ("device_id", 1), ("hour", 1)]
+        cursor = self.collection.find(query, {"_id": 0}, sort=sort, allow_disk_use=True).batch_size(max(1, batch_size // 100))
+        for bucket in cursor:
+            yield from (r for r in reversed(self._flatten(bucket)) if start <= r["timestamp_dt"] < end)
+
+    def _stats_source(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int]) -> List[dict]:
+        match = {"device_id": device_id, "hour": {"$gte": start.replace(minute=0, second=0, microsecond=0), "$lt": end}}
+        if owner_id is not None:
+            match["owner_id"] = owner_id
+        return [
+            {"$match": match},
+            {"$unwind": "$readings"},
+            {"$project": {"timestamp_dt": "$readings.t", "value": "$readings.v"}},
+            {"$match": {"timestamp_dt": {"$gte": start, "$lt": end}}},
+        ]
@@ -1,21 +1,88 @@
+from pymongo import IndexModel
 from pymongo.collection import Collection
-from typing import List, Optional
+from pymongo.errors import BulkWriteError
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+import base64
+import json
+import math
+from dal.index_manager import reconcile_indexes
 from entities.metric import Metric
 
+RETENTION_SECONDS = 604800
+PAGE_SORT = [("timestamp_dt", -1), ("_id", -1)]
+EXPORT_BATCH_SIZE = 1000
+# Repli $push des percentiles (MongoDB < 7.0) : au-delà de ce nombre de valeurs sur la plage, seul un
+# échantillon aléatoire uniforme est poussé (min, max, avg et count restent exacts), ce qui garde chaque
+# document $group loin de la limite de 16 Mo (~16 octets BSON par valeur)
+MAX_PERCENTILE_SAMPLES = 500000
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Datetime naïf en UTC, comme timestamp_dt en base : une borne avec fuseau ('...Z', '+02:00') est convertie"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Percentile par rang le plus proche (p entre 0 et 1) sur une liste triée"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def encode_cursor(timestamp_dt: datetime, last_id: ObjectId) -> str:
+    """Curseur opaque : position (timestamp_dt, _id) du dernier élément de la page"""
+    raw = json.dumps({"t": timestamp_dt.isoformat(), "id": str(last_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Lève ValueError si le curseur est invalide"""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+    except Exception as e:
+        raise ValueError(f"Curseur invalide: {cursor}") from e
+
+def _without_failed(documents: List[dict], error: BulkWriteError) -> List[dict]:
+    """Documents d'un insert_many unordered qui n'apparaissent pas dans writeErrors"""
+    failed = {write_error["index"] for write_error in error.details.get("writeErrors", [])}
+    return [document for index, document in enumerate(documents) if index not in failed]
+
 class MetricDAL:
+    """Stockage "document" : un document MongoDB par mesure"""
+
+    # Les requêtes de ce mode s'expriment en find/aggregate simples, réutilisables par AsyncMetricDAL
+    supports_async = True
+
+    # Index déclarés : un par forme de requête (filtre d'égalité puis tri (timestamp_dt, _id)).
+    # Réconciliés au démarrage (cf. dal.index_manager) : seuls les index de LEGACY_INDEXES sont supprimés.
+    INDEXES = [
+        # TTL (Time To Live) de 7 jours
+        IndexModel("timestamp_dt", expireAfterSeconds=RETENTION_SECONDS),
+        # page_by_device, get_latest, get_range, get_stats
+        IndexModel([("device_id", 1), ("timestamp_dt", -1), ("_id", -1)]),
+        # page_by_owner
+        IndexModel([("owner_id", 1), ("timestamp_dt", -1), ("_id", -1)]),
+        # page_by_type
+        IndexModel([("metric_type", 1), ("timestamp_dt", -1), ("_id", -1)]),
+        # page_by_filters owner + type ("température de mes devices sur 2 h")
+        IndexModel([("owner_id", 1), ("metric_type", 1), ("timestamp_dt", -1), ("_id", -1)]),
+    ]
+    # Index créés par les versions précédentes, remplacés par ceux ci-dessus
+    LEGACY_INDEXES = ["owner_id_1", "device_id_1_timestamp_dt_-1"]
+
     def __init__(self, collection: Collection):
         self.collection = collection
-        # Création d'un index TTL (Time To Live) de 7 jours
-        self.collection.create_index("timestamp_dt", expireAfterSeconds=604800)
-        # Index composé pour la recherche rapide par device et tri par date
-        self.collection.create_index([("device_id", 1), ("timestamp_dt", -1)])
-        # Index pour la recherche par owner
-        self.collection.create_index("owner_id")
+        self._percentile_supported: Optional[bool] = None
+        self._ensure_indexes()
 
-    def insert_metric(self, metric: Metric):
+    def _ensure_indexes(self):
+        reconcile_indexes(self.collection, self.INDEXES, legacy=self.LEGACY_INDEXES)
+
+    def _to_document(self, metric: Metric) -> dict:
         data = metric.to_dict()
         # On ajoute une version "Date" du timestamp pour l'index TTL de MongoDB
-        from datetime import datetime
         try:
             if isinstance(metric.timestamp, str):
                 data["timestamp_dt"] = datetime.fromisoformat(metric.timestamp.replace("Z", ""))
@@ -23,17 +90,257 @@ class MetricDAL:
                 data["timestamp_dt"] = metric.timestamp
         except Exception:
             data["timestamp_dt"] = datetime.utcnow()
-            
-        self.collection.insert_one(data)
+        return data
+
+    def insert_metric(self, metric: Metric):
+        self.insert_document(self._to_document(metric))
+
+    def insert_document(self, document: dict):
+        """Insertion d'un document déjà prêt (timestamp_dt inclus), cf. helpers.metric_decoder"""
+        self.collection.insert_one(document)
+
+    def insert_metrics(self, metrics: List[Metric]) -> int:
+        return self.insert_documents([self._to_document(metric) for metric in metrics])
+
+    def insert_documents(self, documents: List[dict]) -> int:
+        """Insertion groupée (unordered) : un seul aller-retour MongoDB pour tout le lot"""
+        return len(self.write_documents(documents))
+
+    def write_documents(self, documents: List[dict]) -> List[dict]:
+        """Comme insert_documents, renvoie les documents effectivement écrits (traitements post-écriture)"""
+        if not documents:
+            return []
+        try:
+            self.collection.insert_many(documents, ordered=False)
+            return documents
+        except BulkWriteError as e:
+            # En mode unordered, les documents valides sont insérés malgré les erreurs
+            return _without_failed(documents, e)
+
+    @staticmethod
+    def _field(name: str) -> str:
+        """Chemin MongoDB d'un champ descriptif (device_id, owner_id, metric_type, unit)"""
+        return name
+
+    @staticmethod
+    def _output(document: dict) -> dict:
+        """Document stocké -> format exposé par l'API"""
+        document.pop("_id", None)
+        return document
+
+    def _query(self, owner_id: Optional[int] = None, **filters) -> dict:
+        query = {self._field(name): value for name, value in filters.items()}
+        if owner_id is not None:
+            query[self._field("owner_id")] = owner_id
+        return query
+
+    @staticmethod
+    def _keyset_query(query: dict, cursor: Optional[str]) -> dict:
+        """Positionne la requête après le dernier élément servi (timestamp_dt, _id).
+
+        La borne timestamp_dt <= last_dt est portée par l'index ; l'exclusion des ex aequo déjà servis
+        passe par $nor (simple filtre) plutôt que par un $or que le planificateur découperait en
+        sous-plans sans tri par l'index.
+        """
+        if not cursor:
+            return query
+        last_dt, last_id = decode_cursor(cursor)
+        return {
+            "$and": [query, {"timestamp_dt": {"$lte": last_dt}}],
+            "$nor": [{"timestamp_dt": last_dt, "_id": {"$gte": last_id}}],
+        }
 
-    def get_by_device(self, device_id: str, skip: int = 0, limit: int = 50) -> List[dict]:
-        return list(self.collection.find({"device_id": device_id}, {"_id": 0}).sort("timestamp_dt", -1).skip(skip).limit(limit))
+    def _page_result(self, documents: List[dict], limit: int) -> Tuple[List[dict], Optional[str]]:
+        next_cursor = None
+        if limit and len(documents) == limit:
+            next_cursor = encode_cursor(documents[-1]["timestamp_dt"], documents[-1]["_id"])
+        return [self._output(d) for d in documents], next_cursor
+
+    def _find_page(self, query: dict, limit: int, cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[dict], Optional[str]]:
+        """Pagination par clé (timestamp_dt, _id) décroissante : le curseur positionne directement
+        la requête après le dernier élément servi, sans parcourir les pages précédentes"""
+        query = self._keyset_query(query, cursor)
+        documents = list(self.collection.find(query).sort(PAGE_SORT).skip(skip).limit(limit))
+        return self._page_result(documents, limit)
+
+    def page_by_device(self, device_id: str, limit: int = 50, cursor: Optional[str] = None, skip: int = 0,
+                       owner_id: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+        return self._find_page(self._query(owner_id, device_id=device_id), limit, cursor, skip)
+
+    def page_by_owner(self, owner_id: int, limit: int = 50, cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[dict], Optional[str]]:
+        return self._find_page(self._query(owner_id), limit, cursor, skip)
+
+    def page_by_type(self, metric_type: str, limit: int = 50, cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[dict], Optional[str]]:
+        return self._find_page(self._query(metric_type=metric_type), limit, cursor, skip)
+
+    def _filter_query(self, start: datetime, end: datetime, device_ids: Optional[List[str]],
+                      owner_id: Optional[int], metric_type: Optional[str]) -> dict:
+        """Égalités (ou $in sur les devices) puis intervalle sur timestamp_dt : une seule requête bornée
+        servie par l'index composé (champ d'égalité, timestamp_dt, _id) correspondant"""
+        query = self._query(owner_id)
+        if device_ids:
+            query[self._field("device_id")] = device_ids[0] if len(device_ids) == 1 else {"$in": device_ids}
+        if metric_type:
+            query[self._field("metric_type")] = metric_type
+        query["timestamp_dt"] = {"$gte": start, "$lte": end}
+        return query
+
+    def page_by_filters(self, start: datetime, end: datetime, device_ids: Optional[List[str]] = None,
+                        owner_id: Optional[int] = None, metric_type: Optional[str] = None, limit: int = 50,
+                        cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Mesures de [start, end] combinant device(s), owner et type, plus récentes d'abord"""
+        return self._find_page(self._filter_query(start, end, device_ids, owner_id, metric_type), limit, cursor)
+
+    def get_by_device(self, device_id: str, skip: int = 0, limit: int = 50, owner_id: Optional[int] = None) -> List[dict]:
+        return self.page_by_device(device_id, limit, skip=skip, owner_id=owner_id)[0]
 
     def get_by_owner(self, owner_id: int, skip: int = 0, limit: int = 50) -> List[dict]:
-        return list(self.collection.find({"owner_id": owner_id}, {"_id": 0}).sort("timestamp_dt", -1).skip(skip).limit(limit))
+        return self.page_by_owner(owner_id, limit, skip=skip)[0]
 
     def get_by_type(self, metric_type: str, skip: int = 0, limit: int = 50) -> List[dict]:
-        return list(self.collection.find({"metric_type": metric_type}, {"_id": 0}).sort("timestamp_dt", -1).skip(skip).limit(limit))
+        return self.page_by_type(metric_type, limit, skip=skip)[0]
 
     def get_latest(self, device_id: str) -> Optional[dict]:
-        return self.collection.find_one({"device_id": device_id}, sort=[("timestamp_dt", -1)], projection={"_id": 0})
+        document = self.collection.find_one(self._query(device_id=device_id), sort=[("timestamp_dt", -1)])
+        return self._output(document) if document else None
+
+    def _range_query(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int]) -> dict:
+        query = self._query(owner_id, device_id=device_id)
+        query["timestamp_dt"] = {"$gte": start, "$lte": end}
+        return query
+
+    def get_range(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int] = None, limit: int = 10000) -> List[dict]:
+        """Mesures brutes d'un device sur [start, end], par date croissante"""
+        query = self._range_query(device_id, start, end, owner_id)
+        return [self._output(d) for d in self.collection.find(query).sort("timestamp_dt", 1).limit(limit)]
+
+    def iter_range(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int] = None,
+                   batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+        """Comme get_range sans limite ni matérialisation : le curseur MongoDB est lu par lots (export)"""
+        query = self._range_query(device_id, start, end, owner_id)
+        for document in self.collection.find(query).sort("timestamp_dt", 1).batch_size(batch_size):
+            yield self._output(document)
+
+    def iter_period(self, start: datetime, end: datetime, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[dict]:
+        """Toutes les mesures de [start, end[, tous devices confondus (archivage), triées par owner, device
+        puis date : l'archive écrit un owner à la fois. Le tri n'est couvert par aucun index, MongoDB peut
+        le déborder sur disque (allowDiskUse) au lieu d'échouer à 100 Mo."""
+        query = {"timestamp_dt": {"$gte": start, "$lt": end}}
+        sort = [(self._field("owner_id"), 1), (self._field("device_id"), 1), ("timestamp_dt", 1)]
+        for document in self.collection.find(query, sort=sort, allow_disk_use=True).batch_size(batch_size):
+            yield self._output(document)
+
+    def _stats_source(self, device_id: str, start: datetime, end: datetime, owner_id: Optional[int]) -> List[dict]:
+        """Étapes initiales du pipeline de stats : produit des documents {timestamp_dt, value}"""
+        match = self._query(owner_id, device_id=device_id)
+        match["timestamp_dt"] = {"$gte": start, "$lt": end}
+        # Le $match en tête exploite l'index (device_id, timestamp_dt)
+        return [{"$match": match}]
+
+    def _supports_percentile(self) -> bool:
+        """L'accumulateur $percentile n'existe qu'à partir de MongoDB 7.0"""
+        if self._percentile_supported is None:
+            version = self.collection.database.client.server_info().get("versionArray", [0])
+            self._percentile_supported = version[0] >= 7
+        return self._percentile_supported
+
+    def _stats_count_pipeline(self, device_id: str, start: datetime, end: datetime, field: Optional[str],
+                              owner_id: Optional[int]) -> List[dict]:
+        """Nombre de valeurs numériques de la plage : taux d'échantillonnage du repli $push"""
+        value = f"value.{field}" if field else "value"
+        return self._stats_source(device_id, start, end, owner_id) + [
+            {"$match": {value: {"$type": "number"}}},
+            {"$count": "n"},
+        ]
+
+    @staticmethod
+    def _sample_rate(rows: List[dict]) -> float:
+        count = rows[0]["n"] if rows else 0
+        return min(1.0, MAX_PERCENTILE_SAMPLES / count) if count else 1.0
+
+    def _stats_pipeline(self, device_id: str, start: datetime, end: datetime, bucket_seconds: int,
+                        percentiles: List[float], native_percentile: bool, field: Optional[str],
+                        owner_id: Optional[int], sample_rate: float = 1.0) -> List[dict]:
+        value = f"$value.{field}" if field else "$value"
+        group = {
+            "_id": {"$dateTrunc": {"date": "$timestamp_dt", "unit": "second", "binSize": bucket_seconds}},
+            "min": {"$min": value},
+            "max": {"$max": value},
+            "avg": {"$avg": value},
+            "count": {"$sum": 1},
+        }
+        if native_percentile:
+            group["percentiles"] = {"$percentile": {"input": value, "p": percentiles, "method": "approximate"}}
+        elif percentiles:
+            # Hors échantillon, $$REMOVE : la valeur n'est pas poussée
+            pushed = value if sample_rate >= 1 else {"$cond": [{"$lt": [{"$rand": {}}, sample_rate]}, value, "$$REMOVE"]}
+            group["values"] = {"$push": pushed}
+
+        return self._stats_source(device_id, start, end, owner_id) + [
+            {"$project": {"timestamp_dt": 1, "value": 1}},
+            {"$match": {value[1:]: {"$type": "number"}}},
+            {"$group": group},
+            {"$sort": {"_id": 1}},
+        ]
+
+    @staticmethod
+    def _stats_row(row: dict, percentiles: List[float], native_percentile: bool) -> dict:
+        if native_percentile:
+            values = row["percentiles"]
+        elif percentiles:
+            ordered = sorted(v for v in row["values"] if v is not None)
+            values = [percentile(ordered, p) for p in percentiles] if ordered else [None] * len(percentiles)
+        else:
+            values = []
+        return {
+            "timestamp": row["_id"],
+            "min": row["min"],
+            "max": row["max"],
+            "avg": row["avg"],
+            "count": row["count"],
+            "percentiles": {f"p{round(p * 100, 1):g}": v for p, v in zip(percentiles, values)},
+        }
+
+    def _explain_find(self, query: dict, sort: List[tuple], limit: int = 50) -> dict:
+        return self.collection.find(query).sort(sort).limit(limit).explain()
+
+    def _explain_aggregate(self, pipeline: List[dict]) -> dict:
+        return self.collection.database.command("aggregate", self.collection.name, pipeline=pipeline, explain=True)
+
+    def explain_queries(self, device_id: str, owner_id: int, metric_type: str) -> Dict[str, dict]:
+        """Plan d'exécution (explain) de chaque forme de requête du DAL, cf. test/check_query_plans.py"""
+        now = datetime.utcnow()
+        start = now - timedelta(days=1)
+        cursor = encode_cursor(now, ObjectId())
+        shapes = {
+            "page_by_device": self._query(device_id=device_id),
+            "page_by_device (owner)": self._query(owner_id, device_id=device_id),
+            "page_by_owner": self._query(owner_id),
+            "page_by_type": self._query(metric_type=metric_type),
+            "page_by_filters (devices)": self._filter_query(start, now, [device_id, f"{device_id}-2"], owner_id, None),
+            "page_by_filters (owner, type)": self._filter_query(start, now, None, owner_id, metric_type),
+            "page_by_filters (type)": self._filter_query(start, now, None, None, metric_type),
+        }
+        plans = {}
+        for name, query in shapes.items():
+            plans[name] = self._explain_find(query, PAGE_SORT)
+            plans[f"{name} (cursor)"] = self._explain_find(self._keyset_query(query, cursor), PAGE_SORT)
+        plans["get_latest"] = self._explain_find(self._query(device_id=device_id), [("timestamp_dt", -1)], 1)
+        plans["get_range"] = self._explain_find(self._range_query(device_id, start, now, owner_id), [("timestamp_dt", 1)], 10000)
+        plans["get_stats"] = self._explain_aggregate(self._stats_pipeline(device_id, start, now, 3600, [], False, None, owner_id))
+        return plans
+
+    def get_stats(self, device_id: str, start: datetime, end: datetime, bucket_seconds: int,
+                  percentiles: List[float], field: Optional[str] = None, owner_id: Optional[int] = None) -> List[dict]:
+        """Statistiques par bucket temporel (min, max, avg, count, percentiles) calculées par MongoDB"""
+        native_percentile = bool(percentiles) and self._supports_percentile()
+        sample_rate = 1.0
+        if percentiles and not native_percentile:
+            sample_rate = self._sample_rate(list(self.collection.aggregate(
+                self._stats_count_pipeline(device_id, start, end, field, owner_id), allowDiskUse=True)))
+        pipeline = self._stats_pipeline(device_id, start, end, bucket_seconds, percentiles, native_percentile, field,
+                                        owner_id, sample_rate)
+        return [
+            self._stats_row(row, percentiles, native_percentile)
+            for row in self.collection.aggregate(pipeline, allowDiskUse=True)
+        ]
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from pymongo import IndexModel, UpdateOne
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+from dal.index_manager import reconcile_indexes
+from dal.metric_dal import RETENTION_SECONDS
+from helpers.logger import logger
+
+# Niveau -> (résolution en secondes, champs remis à zéro pour obtenir le début du bucket)
+TIERS = {
+    "1m": (60, {"second": 0, "microsecond": 0}),
+    "1h": (3600, {"minute": 0, "second": 0, "microsecond": 0}),
+    "1d": (86400, {"hour": 0, "minute": 0, "second": 0, "microsecond": 0}),
+}
+
+class MetricRollupDAL:
+    """Agrégats incrémentaux (min, max, avg, count, last) par device/type sur 3 niveaux : 1m, 1h, 1d.
+
+    Un document par (device_id, metric_type, bucket) dans metrics_rollup_<niveau>, avec sa propre
+    rétention (index TTL sur bucket). Les valeurs composées (ex. system) sont agrégées par sous-champ
+    numérique sous le type "<type>.<champ>".
+    """
+
+    def __init__(self, db: Database, retention_days: Dict[str, int], collection_prefix: str = "metrics_rollup_",
+                 raw_retention_seconds: int = RETENTION_SECONDS):
+        # Profondeur des mesures brutes : rétention MongoDB, ou celle de l'archive froide si activée
+        self.raw_retention_seconds = raw_retention_seconds
+        self.collections = {tier: db[f"{collection_prefix}{tier}"] for tier in TIERS}
+        self.retention_seconds = {tier: retention_days[tier] * 86400 for tier in TIERS}
+        for tier, collection in self.collections.items():
+            reconcile_indexes(collection, [
+                IndexModel("bucket", expireAfterSeconds=self.retention_seconds[tier]),
+                # Clé d'upsert, sert aussi à get_range filtré par metric_type
+                IndexModel([("device_id", 1), ("metric_type", 1), ("bucket", -1)], unique=True),
+                # get_range tous types confondus : tri par bucket sans SORT en mémoire
+                IndexModel([("device_id", 1), ("bucket", -1)]),
+            ])
+
+    @staticmethod
+    def _numeric_series(document: dict) -> Iterator[Tuple[str, float]]:
+        value = document.get("value")
+        if isinstance(value, bool):
+            return
+        if isinstance(value, (int, float)):
+            yield document["metric_type"], value
+        elif isinstance(value, dict):
+            for key, sub_value in value.items():
+                if isinstance(sub_value, (int, float)) and not isinstance(sub_value, bool):
+                    yield f"{document['metric_type']}.{key}", sub_value
+
+    @staticmethod
+    def _partials(documents: List[dict], tier: str) -> Dict[Tuple[str, str, datetime], dict]:
+        """Pré-agrégation du lot en mémoire : un seul upsert par bucket touché"""
+        floor = TIERS[tier][1]
+        partials: Dict[Tuple[str, str, datetime], dict] = {}
+        for document in documents:
+            ts = document["timestamp_dt"]
+            bucket = ts.replace(**floor)
+            for metric_type, value in MetricRollupDAL._numeric_series(document):
+                key = (document["device_id"], metric_type, bucket)
+                p = partials.get(key)
+                if p is None:
+                    partials[key] = {"owner_id": document.get("owner_id"), "unit": document.get("unit"),
+                                     "min": value, "max": value, "sum": value, "count": 1,
+                                     "last": value, "last_dt": ts}
+                    continue
+                p["min"] = min(p["min"], value)
+                p["max"] = max(p["max"], value)
+                p["sum"] += value
+                p["count"] += 1
+                if ts >= p["last_dt"]:
+                    p["last"], p["last_dt"] = value, ts
+        return partials
+
+    @staticmethod
+    def _merge_pipeline(p: dict) -> List[dict]:
+        """Fusion côté serveur (pipeline update) : les références "$champ" désignent l'état existant"""
+        return [{"$set": {
+            "owner_id": p["owner_id"],
+            "unit": p["unit"],
+            "min": {"$min": ["$min", p["min"]]},
+            "max": {"$max": ["$max", p["max"]]},
+            "sum": {"$add": [{"$ifNull": ["$sum", 0]}, p["sum"]]},
+            "count": {"$add": [{"$ifNull": ["$count", 0]}, p["count"]]},
+            "last": {"$cond": [{"$gte": [p["last_dt"], {"$ifNull": ["$last_dt", p["last_dt"]]}]}, p["last"], "$last"]},
+            "last_dt": {"$max": ["$last_dt", p["last_dt"]]},
+        }}]
+
+    def apply(self, documents: List[dict]):
+        """Met à jour les 3 niveaux à partir de documents prêts à insérer (cf. helpers.metric_decoder)"""
+        for tier, collection in self.collections.items():
+            partials = self._partials(documents, tier)
+            if not partials:
+                continue
+            ops = [
+                UpdateOne({"device_id": device_id, "metric_type": metric_type, "bucket": bucket},
+                          self._merge_pipeline(p), upsert=True)
+                for (device_id, metric_type, bucket), p in partials.items()
+            ]
+            try:
+                collection.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                # Un conflit d'upsert concurrent ne doit pas bloquer les autres buckets
+                logger.warning("Rollup %s - %d buckets en erreur", tier, len(e.details.get("writeErrors", [])))
+
+    def choose_tier(self, start: datetime, end: datetime, min_points: int, now: Optional[datetime] = None) -> str:
+        """Niveau le plus grossier couvrant [start, end] avec au moins min_points points.
+
+        "raw" désigne les mesures brutes. Si aucun niveau ne donne assez de points, on prend le plus
+        fin dont la rétention couvre encore start.
+        """
+        now = now or datetime.utcnow()
+        span = max((end - start).total_seconds(), 1)
+        candidates = [("raw", 1, self.raw_retention_seconds)] + [
+            (tier, resolution, self.retention_seconds[tier]) for tier, (resolution, _) in TIERS.items()
+        ]
+        covering = [c for c in candidates if start >= now - timedelta(seconds=c[2])]
+        if not covering:
+            return "1d"
+        for tier, resolution, _ in reversed(covering):
+            if span / resolution >= min_points:
+                return tier
+        return covering[0][0]
+
+    @staticmethod
+    def _range_query(tier: str, device_id: str, start: datetime, end: datetime,
+                     metric_type: Optional[str], owner_id: Optional[int]) -> dict:
+        query = {"device_id": device_id, "bucket": {"$gte": start.replace(**TIERS[tier][1]), "$lte": end}}
+        if metric_type:
+            query["metric_type"] = metric_type
+        if owner_id is not None:
+            query["owner_id"] = owner_id
+        return query
+
+    def explain_queries(self, device_id: str, owner_id: int, metric_type: str) -> Dict[str, dict]:
+        """Plan d'exécution de get_range par niveau, avec et sans filtre metric_type"""
+        end = datetime.utcnow()
+        plans = {}
+        for tier, collection in self.collections.items():
+            start = end - timedelta(seconds=TIERS[tier][0] * 100)
+            for label, mtype in (("", None), (" (type)", metric_type)):
+                query = self._range_query(tier, device_id, start, end, mtype, owner_id)
+                plans[f"rollup {tier} get_range{label}"] = collection.find(query).sort("bucket", 1).explain()
+        return plans
+
+    def get_range(self, tier: str, device_id: str, start: datetime, end: datetime,
+                  metric_type: Optional[str] = None, owner_id: Optional[int] = None) -> List[dict]:
+        query = self._range_query(tier, device_id, start, end, metric_type, owner_id)
+        cursor = self.collections[tier].find(query, {"_id": 0}).sort("bucket", 1)
+        return [
+            {
+                "metric_type": r["metric_type"],
+                "timestamp": r["bucket"],
+                "min": r["min"],
+                "max": r["max"],
+                "avg": r["sum"] / r["count"] if r["count"] else None,
+                "count": r["count"],
+                "last": r["last"],
+                "unit": r.get("unit"),
+            }
+            for r in cursor
+        ]
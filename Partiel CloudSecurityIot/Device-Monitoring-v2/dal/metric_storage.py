@@ -0,0 +1,18 @@
+from pymongo.database import Database
+from dal.metric_dal import MetricDAL
+from dal.metric_bucket_dal import BucketMetricDAL
+from dal.metric_timeseries_dal import TimeSeriesMetricDAL
+
+# Mode de stockage -> (DAL, suffixe de la collection)
+STORAGE_MODES = {
+    "document": (MetricDAL, ""),
+    "bucket": (BucketMetricDAL, "_buckets"),
+    "timeseries": (TimeSeriesMetricDAL, "_ts"),
+}
+
+def create_metric_dal(db: Database, storage_mode: str = "document", collection_name: str = "metrics") -> MetricDAL:
+    """Instancie le DAL correspondant au mode de stockage (METRIC_STORAGE_MODE)"""
+    if storage_mode not in STORAGE_MODES:
+        raise ValueError(f"Mode de stockage inconnu: {storage_mode}")
+    dal_class, suffix = STORAGE_MODES[storage_mode]
+    return dal_class(db[collection_name + suffix])
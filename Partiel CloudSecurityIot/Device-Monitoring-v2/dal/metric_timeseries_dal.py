@@ -0,0 +1,70 @@
+from typing import List
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+from dal.metric_dal import MetricDAL, RETENTION_SECONDS, _without_failed
+
+META_FIELDS = ("device_id", "owner_id", "metric_type", "unit")
+
+class TimeSeriesMetricDAL(MetricDAL):
+    """Stockage "timeseries" : collection time-series native MongoDB (>= 5.0).
+
+    Les champs descriptifs sont regroupés dans "meta" : MongoDB compresse les mesures d'une même
+    série dans des buckets internes et n'indexe que les buckets, pas chaque mesure.
+    """
+
+    def __init__(self, collection: Collection):
+        db = collection.database
+        if collection.name not in db.list_collection_names():
+            db.create_collection(
+                collection.name,
+                timeseries={"timeField": "timestamp_dt", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=RETENTION_SECONDS
+            )
+        super().__init__(collection)
+
+    # La rétention est portée par la collection (expireAfterSeconds), pas par un index TTL
+    INDEXES = [
+        IndexModel([("meta.device_id", 1), ("timestamp_dt", -1), ("_id", -1)]),
+        IndexModel([("meta.owner_id", 1), ("timestamp_dt", -1), ("_id", -1)]),
+        IndexModel([("meta.metric_type", 1), ("timestamp_dt", -1), ("_id", -1)]),
+        IndexModel([("meta.owner_id", 1), ("meta.metric_type", 1), ("timestamp_dt", -1), ("_id", -1)]),
+    ]
+
+    @staticmethod
+    def _field(name: str) -> str:
+        return f"meta.{name}"
+
+    @staticmethod
+    def _pack(document: dict) -> dict:
+        return {
+            "meta": {field: document[field] for field in META_FIELDS},
+            "value": document["value"],
+            "timestamp": document["timestamp"],
+            "timestamp_dt": document["timestamp_dt"],
+        }
+
+    @staticmethod
+    def _output(document: dict) -> dict:
+        meta = document.get("meta", {})
+        return {
+            "device_id": meta.get("device_id"),
+            "owner_id": meta.get("owner_id"),
+            "metric_type": meta.get("metric_type"),
+            "value": document.get("value"),
+            "unit": meta.get("unit"),
+            "timestamp": document.get("timestamp"),
+            "timestamp_dt": document.get("timestamp_dt"),
+        }
+
+    def insert_document(self, document: dict):
+        self.collection.insert_one(self._pack(document))
+
+    def write_documents(self, documents: List[dict]) -> List[dict]:
+        if not documents:
+            return []
+        try:
+            self.collection.insert_many([self._pack(d) for d in documents], ordered=False)
+            return documents
+        except BulkWriteError as e:
+            return _without_failed(documents, e)
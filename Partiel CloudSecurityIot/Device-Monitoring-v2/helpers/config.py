@@ -1,12 +1,74 @@
 import os
+import socket
 from pymongo import MongoClient
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 JWT_SECRET = os.getenv("JWT_SECRET", "changeme")
+# Registre des devices (Device-Management) : propriété d'un device pour les abonnements temps réel
+DEVICE_SERVICE_URL = os.getenv("DEVICE_SERVICE_URL", "http://device-management:8002")
 
 # MQTT Configuration
 MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "rabbitmq")
 MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "cloud-security-iot/#")
+
+# Consumer group (scale-out) : vide = chaque instance reçoit tout le flux
+CONSUMER_GROUP = os.getenv("CONSUMER_GROUP", "")
+# Par défaut le hostname, soit le nom du pod sous Kubernetes
+CONSUMER_MEMBER_ID = os.getenv("CONSUMER_MEMBER_ID", socket.gethostname())
+# "shared" ($share/<group>/...) | "hash" (partition crc32(device_id) côté client)
+CONSUMER_GROUP_STRATEGY = os.getenv("CONSUMER_GROUP_STRATEGY", "shared")
+CONSUMER_GROUP_SIZE = int(os.getenv("CONSUMER_GROUP_SIZE", "1"))
+CONSUMER_GROUP_INDEX = int(os.environ["CONSUMER_GROUP_INDEX"]) if os.getenv("CONSUMER_GROUP_INDEX") else None
+
+# Stockage des métriques : "document" | "bucket" | "timeseries"
+METRIC_STORAGE_MODE = os.getenv("METRIC_STORAGE_MODE", "document")
+
+# Agrégats 1m / 1h / 1d (rollups) et leur rétention en jours
+ROLLUP_ENABLED = os.getenv("ROLLUP_ENABLED", "false").lower() == "true"
+ROLLUP_RETENTION_DAYS = {
+    "1m": int(os.getenv("ROLLUP_RETENTION_1M_DAYS", "30")),
+    "1h": int(os.getenv("ROLLUP_RETENTION_1H_DAYS", "365")),
+    "1d": int(os.getenv("ROLLUP_RETENTION_1D_DAYS", "1825")),
+}
+
+# Archive froide Parquet des mesures brutes au-delà de la rétention MongoDB (7 jours)
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", "/data/metrics-archive")
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "365"))
+# Délai après minuit (UTC) avant d'archiver la veille : mesures en retard (file d'ingestion, spill, horloges)
+ARCHIVE_GRACE_HOURS = float(os.getenv("ARCHIVE_GRACE_HOURS", "2"))
+
+# Cache Redis des dernières valeurs par device (/metrics/latest)
+LATEST_CACHE_ENABLED = os.getenv("LATEST_CACHE_ENABLED", "true").lower() == "true"
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/1")
+# Durée de vie (secondes) de la dernière valeur d'un device sans nouvelle mesure, défaut = rétention MongoDB
+LATEST_CACHE_TTL = int(os.getenv("LATEST_CACHE_TTL", "604800"))
+
+# Ingestion Configuration
+# "single" : un insert_one par message / "batch" : insert_many bufferisé
+INGEST_MODE = os.getenv("INGEST_MODE", "single")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+
+# Pipeline de workers entre le thread réseau paho et le stockage
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+# "block" | "drop_oldest" | "spill"
+INGEST_OVERFLOW_POLICY = os.getenv("INGEST_OVERFLOW_POLICY", "block")
+INGEST_SPILL_PATH = os.getenv("INGEST_SPILL_PATH", "/tmp/mqtt_spill.log")
+INGEST_STATS_INTERVAL = float(os.getenv("INGEST_STATS_INTERVAL", "30"))
+
+# Canal Redis du client_manager Socket.io de l'API : le consumer y publie directement le flux live
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "socketio")
+
+# Trames live compactes (dictionnaire des devices + msgpack) en plus du JSON, pour les clients qui les demandent.
+# Désactivé par défaut : chaque trame est sinon encodée et publiée une seconde fois, même sans client compact.
+# À positionner à l'identique sur l'API (qui sert alors le JSON aux clients "compact") et sur le consumer.
+LIVE_COMPACT_ENABLED = os.getenv("LIVE_COMPACT_ENABLED", "false").lower() == "true"
+
+# Émission temps réel : période (secondes) de la trame groupée, 0 = un emit par métrique
+LIVE_EMIT_INTERVAL = float(os.getenv("LIVE_EMIT_INTERVAL", "0.25"))
 
 mongo_client = MongoClient(MONGO_URI)
 db = mongo_client["device_monitoring"]
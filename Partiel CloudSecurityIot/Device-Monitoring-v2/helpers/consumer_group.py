@@ -0,0 +1,81 @@
+import re
+import threading
+import time
+import zlib
+from typing import Optional
+
+GROUP_STRATEGIES = ("shared", "hash")
+
+class ConsumerGroup:
+    """Répartition du flux MQTT entre plusieurs instances du consumer.
+
+    Stratégies :
+    - shared : abonnement $share/<group>/<topic>, le broker distribue les messages entre les membres
+               (stabilité par device_id si le broker la supporte, ex. EMQX hash_topic / hash_clientid)
+    - hash   : pour les brokers sans abonnements partagés (plugin MQTT RabbitMQ), chaque membre reçoit
+               tout le flux et ne traite que les device_id dont crc32(device_id) % size == index
+    """
+
+    def __init__(self, group: str, member_id: str, topic: str, strategy: str = "shared",
+                 size: int = 1, index: Optional[int] = None):
+        if strategy not in GROUP_STRATEGIES:
+            raise ValueError(f"Stratégie de groupe inconnue: {strategy}")
+        self.group = group
+        self.member_id = member_id
+        self.topic = topic
+        self.strategy = strategy
+        self.size = max(1, size)
+        # Par défaut, l'index vient de l'ordinal du pod StatefulSet (ex. mqtt-consumer-2)
+        self.index = index if index is not None else self._ordinal(member_id)
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._last_count = 0
+        self._last_time = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.group)
+
+    @property
+    def client_id(self) -> str:
+        return f"{self.group}-{self.member_id}" if self.enabled else ""
+
+    def subscription_topic(self) -> str:
+        if self.enabled and self.strategy == "shared":
+            return f"$share/{self.group}/{self.topic}"
+        return self.topic
+
+    def owns(self, device_id: str) -> bool:
+        """Partition stable : un device est toujours traité par le même membre (stratégie hash)"""
+        if not self.enabled or self.strategy != "hash" or self.size == 1:
+            return True
+        return zlib.crc32(device_id.encode()) % self.size == self.index
+
+    def record(self):
+        """Un message de la partition de ce membre (appelé après owns(), pas à la réception)"""
+        with self._lock:
+            self._processed += 1
+
+    def rate(self) -> float:
+        """Messages/s de la partition de ce membre depuis le dernier appel"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last_time
+            rate = (self._processed - self._last_count) / elapsed if elapsed > 0 else 0.0
+            self._last_count, self._last_time = self._processed, now
+        return rate
+
+    def info(self) -> dict:
+        return {
+            "group": self.group or None,
+            "member_id": self.member_id,
+            "strategy": self.strategy if self.enabled else None,
+            "partition": f"{self.index}/{self.size}" if self.enabled and self.strategy == "hash" else None,
+            "subscription": self.subscription_topic(),
+            "processed": self._processed,
+        }
+
+    @staticmethod
+    def _ordinal(member_id: str) -> int:
+        match = re.search(r"-(\d+)$", member_id)
+        return int(match.group(1)) if match else 0
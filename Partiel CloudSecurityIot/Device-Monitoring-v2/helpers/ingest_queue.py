@@ -0,0 +1,183 @@
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional, Tuple
+from helpers.logger import logger
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+# Le débordement disque est réinjecté dès que la file redescend sous cette fraction de sa capacité
+SPILL_LOW_WATER = 0.5
+SPILL_REPLAY_INTERVAL = 0.2
+
+class IngestQueue:
+    """File bornée entre le callback paho et le pool de workers (parsing + stockage).
+
+    Politiques de débordement :
+    - block       : le callback attend qu'une place se libère (aucune perte)
+    - drop_oldest : le message le plus ancien est supprimé au profit du nouveau
+    - spill       : le message est écrit sur disque puis réinjecté par un thread dédié dès que la file
+                    redescend sous SPILL_LOW_WATER de sa capacité (y compris sous charge continue)
+    """
+
+    def __init__(self, handler: Callable[[str, bytes], None], maxsize: int = 10000, workers: int = 4,
+                 overflow_policy: str = "block", spill_path: str = "/tmp/mqtt_spill.log"):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Politique de débordement inconnue: {overflow_policy}")
+        self.handler = handler
+        self.maxsize = max(1, maxsize)
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self._queue: "queue.Queue[Optional[Tuple[str, bytes]]]" = queue.Queue(self.maxsize)
+        self.low_water = int(self.maxsize * SPILL_LOW_WATER)
+        self._spill_lock = threading.Lock()
+        # Position de lecture dans le fichier de débordement (déjà réinjecté avant cet offset)
+        self._spill_offset = 0
+        # Compteurs incrémentés par plusieurs threads (paho, workers, réinjection)
+        self._stats_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        self._replayer = threading.Thread(target=self._replay_loop, name="ingest-spill-replay", daemon=True)
+        self.processed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.spill_pending = 0
+
+    def start(self):
+        if self.overflow_policy == "spill" and os.path.exists(self.spill_path):
+            # Débordement laissé par l'exécution précédente : réinjecté comme le reste
+            with open(self.spill_path, "r", encoding="utf-8") as f:
+                self.spill_pending = sum(1 for _ in f)
+            logger.info(f"[Ingestion] {self.spill_pending} messages débordés à réinjecter ({self.spill_path})")
+        for worker in self._workers:
+            worker.start()
+        if self.overflow_policy == "spill":
+            self._replayer.start()
+
+    def put(self, topic: str, payload: bytes):
+        """Appelé depuis le thread réseau paho : ne fait qu'enfiler le message brut"""
+        item = (topic, payload)
+        if self.overflow_policy == "block":
+            self._queue.put(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow_policy == "drop_oldest":
+                self._drop_oldest_and_put(item)
+            else:
+                self._spill(item)
+
+    def depth(self) -> int:
+        return self._queue.qsize() + self.spill_pending
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "depth": self._queue.qsize(),
+                "capacity": self.maxsize,
+                "spill_pending": self.spill_pending,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+            }
+
+    def close(self, timeout: float = 30.0):
+        """Vide la file (et le fichier de débordement) puis arrête les workers"""
+        while self.spill_pending:
+            self._replay_spill()
+            time.sleep(0.1)
+        self._stop_event.set()
+        if self._replayer.is_alive():
+            self._replayer.join(timeout=timeout)
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+
+    def _drop_oldest_and_put(self, item: Tuple[str, bytes]):
+        while True:
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                with self._stats_lock:
+                    self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                continue
+
+    def _spill(self, item: Tuple[str, bytes]):
+        topic, payload = item
+        line = json.dumps({"topic": topic, "payload": base64.b64encode(payload).decode("ascii")})
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            with self._stats_lock:
+                self.spilled += 1
+                self.spill_pending += 1
+
+    def _replay_spill(self):
+        """Réinjecte les messages débordés sur disque, dans la limite des places libres de la file.
+        Lecture à partir de l'offset courant : le fichier n'est ni relu ni réécrit en entier à chaque passe."""
+        with self._spill_lock:
+            if not self.spill_pending or not os.path.exists(self.spill_path):
+                return
+            free = self.maxsize - self._queue.qsize()
+            replayed = 0
+            with open(self.spill_path, "r", encoding="utf-8") as f:
+                f.seek(self._spill_offset)
+                while replayed < free:
+                    offset = f.tell()
+                    line = f.readline()
+                    if not line:
+                        break
+                    try:
+                        record = json.loads(line)
+                        self._queue.put_nowait((record["topic"], base64.b64decode(record["payload"])))
+                    except queue.Full:
+                        f.seek(offset)
+                        break
+                    except Exception as e:
+                        logger.error(f"Ligne de débordement illisible ignorée: {e}")
+                    replayed += 1
+                self._spill_offset = f.tell()
+            with self._stats_lock:
+                self.spill_pending -= replayed
+                done = self.spill_pending <= 0
+                if done:
+                    self.spill_pending = 0
+            if done:
+                os.remove(self.spill_path)
+                self._spill_offset = 0
+
+    def _replay_loop(self):
+        """Thread dédié : la réinjection ne dépend pas d'une file complètement vide côté workers"""
+        while not self._stop_event.wait(SPILL_REPLAY_INTERVAL):
+            if self.spill_pending and self._queue.qsize() <= self.low_water:
+                try:
+                    self._replay_spill()
+                except Exception as e:
+                    logger.error(f"Erreur de réinjection du débordement: {e}")
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self.handler(*item)
+                with self._stats_lock:
+                    self.processed += 1
+            except Exception as e:
+                logger.error(f"Erreur worker d'ingestion: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,71 @@
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+import redis
+import redis.asyncio
+
+# Écrase la valeur d'un device seulement si la mesure est au moins aussi récente (messages désordonnés),
+# puis (re)pose le TTL de la clé : un device qui ne publie plus disparaît du cache
+# KEYS = une clé (hash ts/doc) par device ; ARGV[1] = TTL en secondes, puis paires (ts, document)
+_SET_IF_NEWER = """
+local ttl = tonumber(ARGV[1])
+for i = 1, #KEYS do
+    local ts, doc = ARGV[2 * i], ARGV[2 * i + 1]
+    local current = redis.call('HGET', KEYS[i], 'ts')
+    if not current or current <= ts then
+        redis.call('HSET', KEYS[i], 'ts', ts, 'doc', doc)
+        if ttl > 0 then
+            redis.call('EXPIRE', KEYS[i], ttl)
+        end
+    end
+end
+return 1
+"""
+
+class LatestValueCache:
+    """Cache write-through de la dernière métrique par device, dans le Redis déjà utilisé par Socket.io.
+
+    Alimenté par le consumer après écriture MongoDB, lu par /metrics/latest/{device_id} (repli MongoDB
+    sur miss). Une clé par device avec TTL : les devices supprimés ou muets ne restent pas indéfiniment.
+    """
+
+    def __init__(self, redis_url: str, key_prefix: str = "metrics:latest:device", ttl: int = 0):
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self._set_if_newer = self.redis.register_script(_SET_IF_NEWER)
+        # Client asyncio pour les routes async de l'API
+        self.async_redis = redis.asyncio.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+
+    def _key(self, device_id: str) -> str:
+        return f"{self.key_prefix}:{device_id}"
+
+    @staticmethod
+    def _serialize(document: dict) -> str:
+        return json.dumps(
+            {k: v for k, v in document.items() if k != "_id"},
+            default=lambda o: o.isoformat() if isinstance(o, datetime) else str(o)
+        )
+
+    def update_many(self, documents: List[dict]):
+        """Un seul aller-retour Redis par lot, après réduction à la mesure la plus récente par device"""
+        newest: Dict[str, dict] = {}
+        for document in documents:
+            current = newest.get(document["device_id"])
+            if current is None or document["timestamp_dt"] >= current["timestamp_dt"]:
+                newest[document["device_id"]] = document
+        if not newest:
+            return
+        keys, args = [], [self.ttl]
+        for device_id, document in newest.items():
+            keys.append(self._key(device_id))
+            args += [document["timestamp_dt"].isoformat(), self._serialize(document)]
+        self._set_if_newer(keys=keys, args=args)
+
+    def get(self, device_id: str) -> Optional[dict]:
+        raw = self.redis.hget(self._key(device_id), "doc")
+        return json.loads(raw) if raw else None
+
+    async def aget(self, device_id: str) -> Optional[dict]:
+        raw = await self.async_redis.hget(self._key(device_id), "doc")
+        return json.loads(raw) if raw else None
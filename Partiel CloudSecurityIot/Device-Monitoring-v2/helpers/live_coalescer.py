@@ -0,0 +1,69 @@
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from helpers.logger import logger
+
+class LiveCoalescer:
+    """Ne garde que la valeur la plus récente par (device_id, metric_type) et émet une trame groupée à chaque tick"""
+
+    def __init__(self, emit: Callable[[List[dict]], None], tick: float = 0.25):
+        self.emit = emit
+        self.tick = tick
+        # (device_id, metric_type) -> (timestamp de la mesure, payload)
+        self._pending: Dict[Tuple[str, str], Tuple[Optional[datetime], dict]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._tick_loop, name="live-coalescer", daemon=True)
+        self.received = 0
+        self.emitted = 0
+        self.frames = 0
+
+    @property
+    def collapsed(self) -> int:
+        """Nombre de messages écrasés par une valeur plus récente (ou ignorés car plus anciens) avant émission"""
+        return self.received - self.emitted - len(self._pending)
+
+    def start(self):
+        self._thread.start()
+
+    def add(self, device_id: str, metric_type: str, payload: dict, timestamp: Optional[datetime] = None):
+        """Une mesure plus ancienne que celle déjà en attente (workers concurrents, messages désordonnés) est ignorée"""
+        key = (device_id, metric_type)
+        with self._lock:
+            self.received += 1
+            current = self._pending.get(key)
+            if current is not None and timestamp is not None and current[0] is not None and timestamp < current[0]:
+                return
+            self._pending[key] = (timestamp, payload)
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            frame = [payload for _, payload in self._pending.values()]
+            self._pending = {}
+            # Comptage sous verrou pour que "collapsed" reste cohérent
+            self.emitted += len(frame)
+            self.frames += 1
+        try:
+            self.emit(frame)
+        except Exception as e:
+            logger.error(f"Erreur émission trame live ({len(frame)} métriques): {e}")
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "emitted": self.emitted,
+            "collapsed": self.collapsed,
+            "frames": self.frames,
+        }
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.tick + 1)
+        self.flush()
+
+    def _tick_loop(self):
+        while not self._stop_event.wait(self.tick):
+            self.flush()
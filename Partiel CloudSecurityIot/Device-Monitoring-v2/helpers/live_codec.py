@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+import msgpack
+
+# Champs constants d'un device : envoyés une fois par connexion (dictionnaire), plus dans chaque trame
+META_FIELDS = ("device_id", "owner_id", "name", "type", "unit", "location")
+
+_fromisoformat = datetime.fromisoformat
+_EPOCH = datetime(1970, 1, 1)
+
+def metadata(payload: dict) -> Tuple:
+    return tuple(payload.get(field) for field in META_FIELDS)
+
+def dictionary_entry(index: int, meta: Tuple) -> dict:
+    return dict(zip(META_FIELDS, meta), i=index)
+
+def _epoch_ms(timestamp) -> Optional[int]:
+    if not timestamp:
+        return None
+    try:
+        dt = _fromisoformat(timestamp[:-1] if timestamp[-1] == "Z" else timestamp)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is not None:
+        return int(dt.timestamp() * 1000)
+    return int((dt - _EPOCH).total_seconds() * 1000)
+
+def encode_frame(indexes: List[int], payloads: List[dict]) -> bytes:
+    """Trame compacte msgpack : [[index device, valeur, timestamp epoch ms], ...]"""
+    return msgpack.packb(
+        [[index, payload.get("value"), _epoch_ms(payload.get("timestamp"))] for index, payload in zip(indexes, payloads)],
+        use_bin_type=True
+    )
+
+def decode_frame(frame: bytes) -> List[list]:
+    return msgpack.unpackb(frame, raw=False)
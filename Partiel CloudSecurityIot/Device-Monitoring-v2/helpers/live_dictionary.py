@@ -0,0 +1,71 @@
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+import redis
+import redis.asyncio
+from helpers.live_codec import dictionary_entry, metadata
+
+# Attribue (ou retrouve) l'index compact de chaque device et enregistre ses métadonnées
+# KEYS[1] = device_id -> index, KEYS[2] = index -> métadonnées JSON, KEYS[3] = séquence
+# ARGV = paires (device_id, métadonnées JSON) ; retourne les index dans l'ordre des paires
+_ASSIGN = """
+local result = {}
+for i = 1, #ARGV, 2 do
+    local index = redis.call('HGET', KEYS[1], ARGV[i])
+    if not index then
+        index = redis.call('INCR', KEYS[3])
+        redis.call('HSET', KEYS[1], ARGV[i], index)
+    end
+    redis.call('HSET', KEYS[2], index, ARGV[i + 1])
+    result[#result + 1] = tonumber(index)
+end
+return result
+"""
+
+class LiveDictionary:
+    """Dictionnaire partagé (Redis) des devices du flux live compact : device_id -> index + métadonnées.
+
+    Le consumer attribue les index (cache local, un aller-retour Redis seulement pour un device nouveau
+    ou modifié) ; l'API envoie à chaque connexion compacte les entrées de son périmètre.
+    """
+
+    def __init__(self, redis_url: str, key_prefix: str = "live:dict"):
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+        self.index_key = f"{key_prefix}:index"
+        self.meta_key = f"{key_prefix}:meta"
+        self.sequence_key = f"{key_prefix}:seq"
+        self._assign = self.redis.register_script(_ASSIGN)
+        self._known: Dict[str, Tuple[int, Tuple]] = {}
+        self._lock = threading.Lock()
+        # Client asyncio pour l'API
+        self.async_redis = redis.asyncio.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+
+    def resolve(self, payloads: List[dict]) -> Tuple[List[int], List[dict]]:
+        """Index de chaque payload, et entrées nouvelles ou modifiées à diffuser avant la trame"""
+        pending: Dict[str, Tuple] = {}
+        with self._lock:
+            for payload in payloads:
+                meta = metadata(payload)
+                known = self._known.get(payload["device_id"])
+                if known is None or known[1] != meta:
+                    pending[payload["device_id"]] = meta
+        changed = []
+        if pending:
+            args = []
+            for device_id, meta in pending.items():
+                args += [device_id, json.dumps(meta)]
+            indexes = self._assign(keys=[self.index_key, self.meta_key, self.sequence_key], args=args)
+            with self._lock:
+                for (device_id, meta), index in zip(pending.items(), indexes):
+                    self._known[device_id] = (index, meta)
+                    changed.append(dictionary_entry(index, meta))
+        with self._lock:
+            return [self._known[payload["device_id"]][0] for payload in payloads], changed
+
+    async def entries(self, owner_id: Optional[int] = None) -> List[dict]:
+        """Entrées du dictionnaire, restreintes aux devices d'un owner (None : tous, pour un admin)"""
+        raw = await self.async_redis.hgetall(self.meta_key)
+        entries = [dictionary_entry(int(index), tuple(json.loads(meta))) for index, meta in raw.items()]
+        if owner_id is None:
+            return entries
+        return [e for e in entries if e["owner_id"] is not None and str(e["owner_id"]) == str(owner_id)]
@@ -0,0 +1,39 @@
+from typing import Dict, List, Optional, Set
+
+# Room des admins : reçoit tout le flux (comportement historique du dashboard admin)
+ADMIN_ROOM = "admins"
+# Les connexions au format compact (msgpack) rejoignent la variante suffixée de chaque room
+COMPACT_SUFFIX = "|compact"
+
+def owner_room(owner_id) -> str:
+    return f"owner:{owner_id}"
+
+def device_room(device_id: str) -> str:
+    return f"device:{device_id}"
+
+def type_room(metric_type: str, owner_id=None) -> str:
+    """Room par type : globale pour un admin, restreinte aux devices de l'owner sinon"""
+    return f"owner:{owner_id}:type:{metric_type}" if owner_id is not None else f"type:{metric_type}"
+
+def compact_room(room: str) -> str:
+    return room + COMPACT_SUFFIX
+
+def rooms_for_metrics(metrics: List[dict]) -> List[str]:
+    """Toutes les rooms concernées par un lot de payloads publisher (d'un même owner en pratique)"""
+    rooms: Set[str] = {ADMIN_ROOM}
+    for metric in metrics:
+        owner_id = metric.get("owner_id")
+        metric_type = metric.get("type") or metric.get("metric_type")
+        rooms.add(device_room(metric.get("device_id")))
+        rooms.add(type_room(metric_type))
+        if owner_id is not None:
+            rooms.add(owner_room(owner_id))
+            rooms.add(type_room(metric_type, owner_id))
+    return sorted(rooms)
+
+def group_by_owner(metrics: List[dict]) -> Dict[Optional[int], List[dict]]:
+    """Découpe une trame par owner : un emit par owner et par tick, vers ses seules rooms"""
+    groups: Dict[Optional[int], List[dict]] = {}
+    for metric in metrics:
+        groups.setdefault(metric.get("owner_id"), []).append(metric)
+    return groups
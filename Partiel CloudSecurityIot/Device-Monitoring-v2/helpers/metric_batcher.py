@@ -0,0 +1,69 @@
+import threading
+from typing import Callable, List, Optional
+from dal.metric_dal import MetricDAL
+from helpers.logger import logger
+
+class MetricBatcher:
+    """Buffer de documents métriques vidé par insert_many dès que la taille OU le délai maximal est atteint"""
+
+    def __init__(self, metric_dal: MetricDAL, batch_size: int = 500, flush_interval: float = 1.0,
+                 listeners: Optional[List[Callable[[List[dict]], None]]] = None):
+        self.metric_dal = metric_dal
+        # Appelés avec les documents écrits de chaque lot (rollups, cache des dernières valeurs...)
+        self.listeners = listeners or []
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._buffer: List[dict] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="metric-batcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def add(self, document: dict):
+        batch = None
+        with self._lock:
+            self._buffer.append(document)
+            if len(self._buffer) >= self.batch_size:
+                batch = self._swap()
+        # L'écriture se fait hors du verrou pour ne pas bloquer les autres producteurs
+        if batch:
+            self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._swap()
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        """Arrête le timer et vide le lot partiel restant"""
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def _swap(self) -> List[dict]:
+        batch, self._buffer = self._buffer, []
+        return batch
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def _write(self, batch: List[dict]):
+        try:
+            written = self.metric_dal.write_documents(batch)
+            logger.debug("[MongoDB] Lot inséré: %d/%d métriques", len(written), len(batch))
+        except Exception as e:
+            logger.error(f"Erreur lors de l'insertion du lot ({len(batch)} métriques): {e}")
+            return
+        # Seuls les documents écrits alimentent les listeners : le cache ne sert jamais une valeur absente de MongoDB
+        if not written:
+            return
+        for listener in self.listeners:
+            try:
+                listener(written)
+            except Exception as e:
+                logger.error(f"Erreur post-écriture du lot ({len(written)} métriques): {e}")
@@ -0,0 +1,54 @@
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+_loads = json.loads
+_fromisoformat = datetime.fromisoformat
+_utcnow = datetime.utcnow
+
+def decode_metric(raw_payload: bytes) -> Tuple[dict, Optional[dict]]:
+    """Chemin rapide : octets MQTT -> document MongoDB prêt à insérer, en une seule passe.
+
+    Retourne (payload, document). Le document vaut None si le payload est invalide
+    (device_id ou type manquant). Lève ValueError si le JSON est illisible.
+    """
+    # json.loads accepte directement les octets UTF-8 : pas de decode() intermédiaire
+    payload = _loads(raw_payload)
+    if type(payload) is not dict:
+        raise ValueError("Payload JSON non objet")
+    get = payload.get
+
+    device_id = get("device_id")
+    metric_type = get("type") or get("metric_type")
+    if not device_id or not metric_type:
+        return payload, None
+
+    owner_id = get("owner_id")
+    if owner_id is not None and type(owner_id) is not int:
+        try:
+            owner_id = int(owner_id)
+        except (TypeError, ValueError):
+            owner_id = None
+
+    timestamp = get("timestamp")
+    timestamp_dt = None
+    if timestamp:
+        try:
+            # Horodatage naïf, comme pour les documents existants
+            timestamp_dt = _fromisoformat(timestamp[:-1] if timestamp[-1] == "Z" else timestamp)
+        except (TypeError, ValueError):
+            pass
+    if timestamp_dt is None:
+        timestamp_dt = _utcnow()
+        if not timestamp:
+            timestamp = timestamp_dt.isoformat()
+
+    return payload, {
+        "device_id": device_id,
+        "owner_id": owner_id,
+        "metric_type": metric_type,
+        "value": get("value"),
+        "unit": get("unit"),
+        "timestamp": timestamp,
+        "timestamp_dt": timestamp_dt
+    }
@@ -1,95 +1,179 @@
-import os
-import json
+import logging
 import paho.mqtt.client as mqtt
 from pymongo import MongoClient
-from datetime import datetime
 import time
 import socketio
-from helpers.config import MONGO_URI, MQTT_BROKER_HOST, MQTT_BROKER_PORT
-from entities.metric import Metric
-from dal.metric_dal import MetricDAL
+import threading
+from helpers.config import (
+    MONGO_URI, METRIC_STORAGE_MODE, ROLLUP_ENABLED, ROLLUP_RETENTION_DAYS, LATEST_CACHE_ENABLED, LATEST_CACHE_TTL, REDIS_URL, MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_TOPIC,
+    CONSUMER_GROUP, CONSUMER_MEMBER_ID, CONSUMER_GROUP_STRATEGY, CONSUMER_GROUP_SIZE, CONSUMER_GROUP_INDEX,
+    INGEST_MODE, INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL,
+    INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_OVERFLOW_POLICY, INGEST_SPILL_PATH, INGEST_STATS_INTERVAL,
+    LIVE_EMIT_INTERVAL, LIVE_COMPACT_ENABLED, SOCKETIO_CHANNEL
+)
+from dal.metric_storage import create_metric_dal
+from dal.metric_rollup_dal import MetricRollupDAL
+from helpers.metric_batcher import MetricBatcher
+from helpers.ingest_queue import IngestQueue
+from helpers.live_coalescer import LiveCoalescer
+from helpers.consumer_group import ConsumerGroup
+from helpers.metric_decoder import decode_metric
+from helpers.latest_cache import LatestValueCache
+from helpers.live_codec import encode_frame
+from helpers.live_dictionary import LiveDictionary
+from helpers.live_rooms import compact_room, group_by_owner, rooms_for_metrics
 from helpers.logger import logger
 
 class MQTTConsumer:
-    """Helper class to handle MQTT consumption and storage in MongoDB + Socket.io emission"""
+    """Helper class to handle MQTT consumption and storage in MongoDB + Socket.io emission (via Redis)"""
     
     def __init__(self):
         self.mongo_client = MongoClient(MONGO_URI)
         self.db = self.mongo_client["device_monitoring"]
-        self.metrics_col = self.db["metrics"]
-        self.metric_dal = MetricDAL(self.metrics_col)
+        self.metric_dal = create_metric_dal(self.db, METRIC_STORAGE_MODE)
+        self.metrics_col = self.metric_dal.collection
+
+        # Traitements appliqués à chaque lot après écriture MongoDB
+        self.write_listeners = []
+        # Agrégats incrémentaux 1m / 1h / 1d
+        if ROLLUP_ENABLED:
+            self.write_listeners.append(MetricRollupDAL(self.db, ROLLUP_RETENTION_DAYS).apply)
+        # Cache write-through des dernières valeurs (servi par /metrics/latest)
+        if LATEST_CACHE_ENABLED:
+            self.write_listeners.append(LatestValueCache(REDIS_URL, ttl=LATEST_CACHE_TTL).update_many)
+
+        # Mode d'ingestion bufferisé (insert_many) si INGEST_MODE=batch
+        self.batcher = None
+        if INGEST_MODE == "batch":
+            self.batcher = MetricBatcher(self.metric_dal, INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL, self.write_listeners)
+
+        # File bornée : le callback paho ne fait qu'enfiler, les workers parsent et stockent
+        self.ingest_queue = IngestQueue(
+            self.process_message,
+            maxsize=INGEST_QUEUE_SIZE,
+            workers=INGEST_WORKERS,
+            overflow_policy=INGEST_OVERFLOW_POLICY,
+            spill_path=INGEST_SPILL_PATH
+        )
+        self._stop_event = threading.Event()
         
-        # MQTT Client
-        self.mqtt_client = mqtt.Client()
+        # Consumer group : répartition du flux entre les réplicas
+        self.group = ConsumerGroup(
+            CONSUMER_GROUP,
+            CONSUMER_MEMBER_ID,
+            MQTT_TOPIC,
+            strategy=CONSUMER_GROUP_STRATEGY,
+            size=CONSUMER_GROUP_SIZE,
+            index=CONSUMER_GROUP_INDEX
+        )
+
+        # MQTT Client (client_id stable par membre du groupe)
+        self.mqtt_client = mqtt.Client(client_id=self.group.client_id)
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
         
-        # Socket.io Client (to talk to our own Monitoring API)
-        self.sio = socketio.Client()
-        self.api_url = os.getenv("MONITORING_API_URL", "http://monitoring_api:8000")
+        # Publication directe dans le canal Redis des réplicas de l'API (write-only : pas de clients
+        # connectés ici) : le flux live ne dépend plus d'une connexion à un pod de l'API
+        self.live_mgr = socketio.RedisManager(REDIS_URL, channel=SOCKETIO_CHANNEL, write_only=True)
+        # Format compact : index de device partagé entre consumers et API
+        self.live_dictionary = LiveDictionary(REDIS_URL) if LIVE_COMPACT_ENABLED else None
+
+        # Coalescence : dernière valeur par device/type, une trame groupée par tick
+        self.coalescer = None
+        if LIVE_EMIT_INTERVAL > 0:
+            self.coalescer = LiveCoalescer(self.emit_live_frame, LIVE_EMIT_INTERVAL)
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             logger.info(f"Connecté au broker avec succès (code={rc})")
-            client.subscribe("cloud-security-iot/#")
+            topic = self.group.subscription_topic()
+            client.subscribe(topic)
+            logger.info(f"Abonné à '{topic}' (membre={self.group.member_id})")
         else:
             logger.error(f"Échec de connexion au broker (code={rc})")
 
     def on_message(self, client, userdata, msg):
+        # Thread réseau paho : aucun I/O ici pour ne pas bloquer keepalive et lecture socket
+        self.ingest_queue.put(msg.topic, msg.payload)
+
+    def process_message(self, topic: str, raw_payload: bytes):
+        """Exécuté par les workers : parsing, stockage MongoDB et émission Socket.io"""
         try:
-            payload = json.loads(msg.payload.decode())
-            logger.info(f"Message reçu sur topic '{msg.topic}': {payload}")
-            
-            # 1. Préparation de la métrique
-            owner_id = payload.get("owner_id")
-            if owner_id is not None:
-                try: owner_id = int(owner_id)
-                except Exception: owner_id = None
-            
-            timestamp = payload.get("timestamp") or datetime.utcnow().isoformat()
-            
-            metric = Metric(
-                device_id=payload.get("device_id"),
-                owner_id=owner_id,
-                metric_type=payload.get("type") or payload.get("metric_type"),
-                value=payload.get("value"),
-                unit=payload.get("unit"),
-                timestamp=timestamp
-            )
-            
+            # 1. Décodage + validation en une passe : octets -> document prêt à insérer
+            payload, document = decode_metric(raw_payload)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Message reçu sur topic '%s': %s", topic, payload)
+
+            if document is None:
+                logger.warning("Payload de métrique invalide: %s", payload)
+                return
+
+            device_id = document["device_id"]
+
+            # Partition côté client (stratégie hash) : device traité par un autre membre
+            if not self.group.owns(device_id):
+                return
+            # Débit du membre : seuls les messages de sa partition (en hash, chacun reçoit tout le flux)
+            self.group.record()
+
             # 2. Stockage MongoDB
-            if metric.device_id and metric.metric_type:
-                self.metric_dal.insert_metric(metric)
-                logger.debug(f"[MongoDB] Métrique insérée: {metric.device_id}")
-                
-                # 3. Émission Temps Réel via Socket.io
-                if self.sio.connected:
-                    self.sio.emit('new_metric', payload)
-                    logger.info(f"[Socket.io] Métrique diffusée en temps réel")
+            if self.batcher:
+                self.batcher.add(document)
             else:
-                logger.warning(f"Payload de métrique invalide: {payload}")
-                
+                self.metric_dal.insert_document(document)
+                logger.debug("[MongoDB] Métrique insérée: %s", device_id)
+                for listener in self.write_listeners:
+                    try:
+                        listener([document])
+                    except Exception as e:
+                        logger.error("Erreur post-écriture (%s): %s", device_id, e)
+
+            # 3. Émission Temps Réel via Socket.io
+            if self.coalescer:
+                self.coalescer.add(device_id, document["metric_type"], payload, document.get("timestamp_dt"))
+            else:
+                self.publish_live('metrics_live', payload, [payload])
+                logger.debug("[Socket.io] Métrique diffusée en temps réel")
+
         except Exception as e:
-            logger.error(f"Erreur lors du traitement du message: {e}")
+            logger.error("Erreur lors du traitement du message: %s", e)
 
-    def connect_sio(self):
-        """Connect to the Socket.io server (API)"""
-        max_retries = 10
-        for i in range(max_retries):
-            try:
-                logger.info(f"Tentative de connexion Socket.io à {self.api_url}")
-                self.sio.connect(self.api_url)
-                logger.info("✓ Connecté au serveur Socket.io (API)")
-                return True
-            except Exception as e:
-                logger.warning(f"⚠ Échec connexion Socket.io ({i+1}/{max_retries}): {e}")
-                time.sleep(3)
-        return False
+    def emit_live_frame(self, frame):
+        """Publie une trame groupée (dernière valeur par device/type), découpée par owner vers ses seules rooms"""
+        for metrics in group_by_owner(frame).values():
+            self.publish_live('metrics_live_batch', {"metrics": metrics}, metrics)
+        logger.debug(f"[Socket.io] Trame live diffusée ({len(frame)} métriques)")
+
+    def publish_live(self, event: str, data, metrics: list):
+        """JSON vers les rooms des métriques ; en compact, entrées de dictionnaire nouvelles puis trame msgpack"""
+        rooms = rooms_for_metrics(metrics)
+        self.live_mgr.emit(event, data, room=rooms)
+        if not self.live_dictionary:
+            return
+        compact_rooms = [compact_room(room) for room in rooms]
+        indexes, changed = self.live_dictionary.resolve(metrics)
+        if changed:
+            self.live_mgr.emit('metrics_dict', changed, room=compact_rooms)
+        self.live_mgr.emit('metrics_compact', encode_frame(indexes, metrics), room=compact_rooms)
+
+    def _report_stats(self):
+        while not self._stop_event.wait(INGEST_STATS_INTERVAL):
+            logger.info(f"[Groupe] Membre: {self.group.info()} - Débit: {self.group.rate():.1f} msg/s")
+            logger.info(f"[Ingestion] File: {self.ingest_queue.stats()}")
+            if self.coalescer:
+                logger.info(f"[Socket.io] Coalescence: {self.coalescer.stats()}")
 
     def start(self):
-        """Start both MQTT and Socket.io clients"""
-        # Connexion Socket.io en premier (optionnel mais utile pour le debug)
-        self.connect_sio()
+        """Start the MQTT client and the ingestion pipeline"""
+        if self.batcher:
+            logger.info(f"Mode d'ingestion batch (taille={self.batcher.batch_size}, délai={self.batcher.flush_interval}s)")
+            self.batcher.start()
+
+        if self.coalescer:
+            self.coalescer.start()
+
+        self.ingest_queue.start()
+        threading.Thread(target=self._report_stats, name="ingest-stats", daemon=True).start()
         
         # Connexion MQTT
         while True:
@@ -101,4 +185,17 @@ class MQTTConsumer:
                 logger.error(f"Connexion MQTT échouée: {e}. Nouvelle tentative dans 5s...")
                 time.sleep(5)
         
-        self.mqtt_client.loop_forever()
+        try:
+            self.mqtt_client.loop_forever()
+        finally:
+            # Vidage de la file puis du lot partiel à l'arrêt
+            self._stop_event.set()
+            self.ingest_queue.close()
+            if self.batcher:
+                self.batcher.close()
+            if self.coalescer:
+                self.coalescer.close()
+
+    def stop(self):
+        """Arrêt propre : la déconnexion fait sortir loop_forever()"""
+        self.mqtt_client.disconnect()
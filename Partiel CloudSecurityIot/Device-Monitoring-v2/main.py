@@ -1,14 +1,20 @@
 import socketio
+from socketio.exceptions import ConnectionRefusedError
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
-from controllers.metric_controller import router as metric_router
+from fastapi import HTTPException
+from controllers.metric_controller import router as metric_router, verify_device_access, verify_token
+from helpers.config import LIVE_COMPACT_ENABLED, REDIS_URL, SOCKETIO_CHANNEL
+from helpers.live_dictionary import LiveDictionary
+from helpers.live_rooms import ADMIN_ROOM, compact_room, device_room, owner_room, type_room
 import uvicorn
 import os
 
 # 1. Configuration du serveur Socket.io
 # Utilisation de Redis pour synchroniser les événements entre les réplicas (Scale-Out)
-mgr = socketio.AsyncRedisManager('redis://redis:6379/1')
+# Le consumer publie directement le flux live sur ce canal (RedisManager write-only)
+mgr = socketio.AsyncRedisManager(REDIS_URL, channel=SOCKETIO_CHANNEL)
 
 # On augmente la robustesse avec des timeouts explicites
 sio = socketio.AsyncServer(
@@ -20,18 +26,106 @@ sio = socketio.AsyncServer(
 )
 
 # 2. Définition des événements
+# Dictionnaire des devices du format compact (index attribués par le consumer)
+# Construit seulement si le format compact est activé (comme côté consumer)
+live_dictionary = LiveDictionary(REDIS_URL) if LIVE_COMPACT_ENABLED else None
+
+async def join_room(sid, session: dict, room: str, enter: bool = True):
+    """Les connexions compactes rejoignent la variante |compact de la room"""
+    if session.get("compact"):
+        room = compact_room(room)
+    await (sio.enter_room if enter else sio.leave_room)(sid, room)
+
+async def resolve_room(session: dict, subscription: dict) -> str:
+    """Room demandée par un client ({device_id}, {metric_type}, {owner_id} ou {all}), avec contrôle RBAC"""
+    is_admin, user_id = session.get("is_admin", False), session.get("user_id")
+    if subscription.get("device_id"):
+        # Propriété lue dans le registre des devices : un device sans mesure récente reste abonnable par son owner
+        if not is_admin and not await verify_device_access(session["token"], subscription["device_id"]):
+            raise PermissionError("Accès non autorisé à ce device")
+        return device_room(subscription["device_id"])
+    if subscription.get("metric_type"):
+        return type_room(subscription["metric_type"], None if is_admin else user_id)
+    if subscription.get("owner_id") is not None:
+        if not is_admin and subscription["owner_id"] != user_id:
+            raise PermissionError("Accès non autorisé aux données d'un tiers")
+        return owner_room(subscription["owner_id"])
+    if subscription.get("all") and is_admin:
+        return ADMIN_ROOM
+    raise ValueError("Abonnement invalide (device_id, metric_type, owner_id ou all)")
+
+async def dictionary_entries(session: dict) -> list:
+    """Dictionnaire vide si le format compact est désactivé (utilisé aussi par get_dict)"""
+    if live_dictionary is None:
+        return []
+    return await live_dictionary.entries(None if session["is_admin"] else session["user_id"])
+
+async def send_dictionary(sid, session: dict):
+    await sio.emit("metrics_dict", await dictionary_entries(session), to=sid)
+
 @sio.event
-async def connect(sid, environ):
-    print(f"DEBUG_v2: Client connecté (sid={sid})")
+async def connect(sid, environ, auth):
+    """Authentification à la connexion : auth = {"token": <JWT>, "subscribe": [...], "format": "json"|"compact"}
+    (abonnement par défaut : owner, ou tout pour un admin)"""
+    auth = auth or {}
+    if not auth.get("token"):
+        raise ConnectionRefusedError("Token requis")
+    try:
+        payload = await verify_token(auth["token"])
+    except HTTPException:
+        raise ConnectionRefusedError("Token invalide ou expiré")
+    # Token conservé côté serveur : vérification des abonnements ultérieurs auprès du registre des devices
+    session = {"is_admin": payload.get("is_admin", False), "user_id": payload.get("id"), "sub": payload.get("sub"),
+               "token": auth["token"],
+               # Format compact désactivé : le consumer ne publie que le JSON, servi à tous les clients
+               "compact": LIVE_COMPACT_ENABLED and auth.get("format") == "compact"}
+    if not session["is_admin"] and session["user_id"] is None:
+        raise ConnectionRefusedError("Utilisateur inconnu")
+    await sio.save_session(sid, session)
+
+    subscriptions = auth.get("subscribe") or [{"all": True} if session["is_admin"] else {"owner_id": session["user_id"]}]
+    for subscription in subscriptions:
+        try:
+            await join_room(sid, session, await resolve_room(session, subscription))
+        except (PermissionError, ValueError) as e:
+            raise ConnectionRefusedError(str(e))
+    if session["compact"]:
+        # Dictionnaire envoyé une fois, après l'acquittement de la connexion : les trames
+        # metrics_compact ne portent plus que (index, valeur, ts)
+        sio.start_background_task(send_dictionary, sid, session)
+    print(f"DEBUG_v2: Client connecté (sid={sid}, user={session['sub']}, rooms={sio.rooms(sid)})")
 
 @sio.event
 async def disconnect(sid):
     print(f"DEBUG_v2: Client déconnecté (sid={sid})")
 
-@sio.on("new_metric")
-async def handle_new_metric(sid, data):
-    # Diffusion vers tous les clients (Dashboard)
-    await sio.emit("metrics_live", data)
+@sio.on("subscribe")
+async def handle_subscribe(sid, subscription):
+    session = await sio.get_session(sid)
+    try:
+        room = await resolve_room(session, subscription or {})
+    except (PermissionError, ValueError) as e:
+        return {"error": str(e)}
+    await join_room(sid, session, room)
+    return {"room": room}
+
+@sio.on("unsubscribe")
+async def handle_unsubscribe(sid, subscription):
+    session = await sio.get_session(sid)
+    try:
+        room = await resolve_room(session, subscription or {})
+    except (PermissionError, ValueError) as e:
+        return {"error": str(e)}
+    await join_room(sid, session, room, enter=False)
+    return {"room": room}
+
+@sio.on("get_dict")
+async def handle_get_dict(sid, data=None):
+    """Resynchronisation du dictionnaire compact (ex. index inconnu reçu après une reconnexion)"""
+    return await dictionary_entries(await sio.get_session(sid))
+
+# Les événements metrics_live / metrics_live_batch sont publiés par le consumer directement dans Redis
+# vers les rooms concernées : aucun relais par un handler de l'API
 
 # 3. Microservice FastAPI
 fastapi_app = FastAPI(title="Device Monitoring v2 - RealTime")
@@ -42,6 +136,8 @@ fastapi_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Curseur de pagination des routes /metrics (pagination par clé)
+    expose_headers=["X-Next-Cursor"],
 )
 
 fastapi_app.include_router(metric_router)
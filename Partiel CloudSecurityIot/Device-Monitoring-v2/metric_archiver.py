@@ -0,0 +1,52 @@
+"""
+Archivage des métriques brutes avant expiration (TTL MongoDB de 7 jours)
+Chaque journée complète encore entièrement dans MongoDB est compactée en Parquet dans ARCHIVE_PATH
+(la veille seulement ARCHIVE_GRACE_HOURS après minuit UTC), puis les journées au-delà de
+ARCHIVE_RETENTION_DAYS sont supprimées. Idempotent : à lancer chaque jour (CronJob Kubernetes, cron),
+sur le même volume que celui lu par l'API.
+
+Usage : python metric_archiver.py [--day YYYY-MM-DD]
+"""
+import argparse
+import os
+import sys
+from datetime import date, datetime, time, timedelta
+
+# Ajout du dossier courant au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dal.metric_archive import MetricArchive, hot_window_start
+from dal.metric_storage import create_metric_dal
+from helpers.config import ARCHIVE_GRACE_HOURS, ARCHIVE_PATH, ARCHIVE_RETENTION_DAYS, METRIC_STORAGE_MODE, db
+from helpers.logger import logger
+
+def archive_day(metric_dal, archive: MetricArchive, day: date):
+    start = datetime.combine(day, time.min)
+    counts = archive.write_day(day, metric_dal.iter_period(start, start + timedelta(days=1)))
+    logger.info("[Archive] %s - %d mesures, %d owners", day, sum(counts.values()), len(counts))
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivage Parquet des métriques avant expiration")
+    parser.add_argument("--day", type=date.fromisoformat, help="(Ré)archiver une journée précise")
+    args = parser.parse_args()
+
+    metric_dal = create_metric_dal(db, METRIC_STORAGE_MODE)
+    archive = MetricArchive(ARCHIVE_PATH)
+    if args.day:
+        archive_day(metric_dal, archive, args.day)
+        return
+
+    now = datetime.utcnow()
+    today = now.date()
+    # Une journée n'est figée qu'après ARCHIVE_GRACE_HOURS : les mesures arrivées en retard y sont incluses
+    last_closed = (now - timedelta(hours=ARCHIVE_GRACE_HOURS)).date()
+    day = hot_window_start(now).date()
+    while day < last_closed:
+        if not archive.is_archived(day):
+            archive_day(metric_dal, archive, day)
+        day += timedelta(days=1)
+    archive.prune(today - timedelta(days=ARCHIVE_RETENTION_DAYS))
+
+if __name__ == "__main__":
+    print("=== Metric Archiver Starting ===", flush=True)
+    main()
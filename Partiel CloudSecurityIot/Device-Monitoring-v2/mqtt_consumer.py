@@ -4,6 +4,7 @@ Désormais architecturé via helpers/mqtt_consumer_helper.py
 """
 import sys
 import os
+import signal
 
 # Ajout du dossier courant au path pour les imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -13,4 +14,9 @@ from helpers.mqtt_consumer_helper import MQTTConsumer
 if __name__ == "__main__":
     print("=== MQTT Consumer Service Starting ===", flush=True)
     consumer = MQTTConsumer()
-    consumer.start()
+    # SIGTERM (docker stop / kubectl) : arrêt propre pour vider les buffers
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+    try:
+        consumer.start()
+    except KeyboardInterrupt:
+        pass
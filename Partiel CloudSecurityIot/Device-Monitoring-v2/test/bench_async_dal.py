@@ -0,0 +1,91 @@
+"""
+Benchmark des lectures MetricDAL : chemin synchrone (pymongo dans un threadpool de 40 threads, comme les
+routes `def` de FastAPI/Starlette) contre chemin asyncio (AsyncMetricDAL sur Motor, un seul thread).
+Nécessite un MongoDB joignable (MONGO_URI) : les données de test sont insérées dans une collection dédiée
+puis supprimées.
+
+Usage : MONGO_URI=mongodb://localhost:27017 python test/bench_async_dal.py [nb_requetes] [concurrence]
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from dal.metric_async_dal import AsyncMetricDAL
+from dal.metric_storage import create_metric_dal
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = "device_monitoring_bench"
+COLLECTION = "metrics_bench"
+DEVICES = 200
+THREADPOOL_SIZE = 40
+
+def seed(dal, per_device=50):
+    now = datetime.utcnow()
+    documents = [
+        {
+            "device_id": f"device-{d}",
+            "owner_id": d % 20,
+            "metric_type": "temperature",
+            "value": 20.0 + i % 10,
+            "unit": "°C",
+            "timestamp": (now - timedelta(seconds=i)).isoformat(),
+            "timestamp_dt": now - timedelta(seconds=i),
+        }
+        for d in range(DEVICES) for i in range(per_device)
+    ]
+    dal.insert_documents(documents)
+
+def bench_sync(dal, n, concurrency):
+    with ThreadPoolExecutor(max_workers=min(concurrency, THREADPOOL_SIZE)) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda i: dal.page_by_device(f"device-{i % DEVICES}", 50), range(n)))
+        return n / (time.perf_counter() - start)
+
+async def bench_async(async_dal, n, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await async_dal.page_by_device(f"device-{i % DEVICES}", 50)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return n / (time.perf_counter() - start)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    client = MongoClient(MONGO_URI, maxPoolSize=concurrency)
+    client.drop_database(DB_NAME)
+    dal = create_metric_dal(client[DB_NAME], os.getenv("METRIC_STORAGE_MODE", "document"), COLLECTION)
+    seed(dal)
+
+    async def run_async():
+        async_client = AsyncIOMotorClient(MONGO_URI, maxPoolSize=concurrency)
+        async_dal = AsyncMetricDAL(dal, async_client[DB_NAME][dal.collection.name])
+        try:
+            return await bench_async(async_dal, n, concurrency)
+        finally:
+            async_client.close()
+
+    try:
+        sync_rate = bench_sync(dal, n, concurrency)
+        async_rate = asyncio.run(run_async())
+    finally:
+        client.drop_database(DB_NAME)
+        client.close()
+
+    print(f"{n} requêtes page_by_device, concurrence {concurrency}")
+    print(f"  sync  (threadpool {THREADPOOL_SIZE}) : {sync_rate:10.0f} req/s")
+    print(f"  async (Motor)          : {async_rate:10.0f} req/s  (x{async_rate / sync_rate:.2f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark du décodage des messages MQTT (mono-cœur, sans MongoDB)
+Compare l'ancien chemin de on_message (decode + json.loads + log f-string + Metric + fromisoformat)
+au chemin rapide helpers.metric_decoder.decode_metric.
+
+Usage : python test/bench_decode.py [nb_messages]
+"""
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entities.metric import Metric
+from helpers.metric_decoder import decode_metric
+
+logger = logging.getLogger("bench_decode")
+logger.addHandler(logging.NullHandler())
+logger.setLevel(logging.WARNING)
+logger.propagate = False
+
+def make_payloads(n):
+    return [
+        json.dumps({
+            "device_id": f"device-{i % 1000}",
+            "owner_id": str(i % 50),
+            "name": f"Capteur {i % 1000}",
+            "type": "temperature",
+            "value": 21.5 + (i % 10),
+            "unit": "°C",
+            "status": "active",
+            "location": "Salle serveur",
+            "timestamp": datetime.now().isoformat()
+        }).encode()
+        for i in range(n)
+    ]
+
+def legacy_path(raw, topic="cloud-security-iot/temperature"):
+    payload = json.loads(raw.decode())
+    logger.info(f"Message reçu sur topic '{topic}': {payload}")
+    owner_id = payload.get("owner_id")
+    if owner_id is not None:
+        try: owner_id = int(owner_id)
+        except Exception: owner_id = None
+    timestamp = payload.get("timestamp") or datetime.utcnow().isoformat()
+    metric = Metric(
+        device_id=payload.get("device_id"),
+        owner_id=owner_id,
+        metric_type=payload.get("type") or payload.get("metric_type"),
+        value=payload.get("value"),
+        unit=payload.get("unit"),
+        timestamp=timestamp
+    )
+    data = metric.to_dict()
+    try:
+        if isinstance(metric.timestamp, str):
+            data["timestamp_dt"] = datetime.fromisoformat(metric.timestamp.replace("Z", ""))
+        else:
+            data["timestamp_dt"] = metric.timestamp
+    except Exception:
+        data["timestamp_dt"] = datetime.utcnow()
+    return data
+
+def fast_path(raw, topic="cloud-security-iot/temperature"):
+    payload, document = decode_metric(raw)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Message reçu sur topic '%s': %s", topic, payload)
+    return document
+
+def bench(name, fn, payloads):
+    start = time.perf_counter()
+    for raw in payloads:
+        fn(raw)
+    elapsed = time.perf_counter() - start
+    rate = len(payloads) / elapsed
+    print(f"{name:<8} {rate:>12,.0f} msg/s/cœur  ({elapsed * 1e6 / len(payloads):.2f} µs/msg)")
+    return rate
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    payloads = make_payloads(n)
+    assert legacy_path(payloads[0]) == fast_path(payloads[0])
+    before = bench("avant", legacy_path, payloads)
+    after = bench("après", fast_path, payloads)
+    print(f"gain     x{after / before:.2f}")
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark des trames live : JSON brut du publisher (metrics_live_batch) contre format compact
+(dictionnaire des devices envoyé une fois + trame msgpack [index, valeur, ts]). Mesure les octets
+par trame et le coût d'encodage, sans Redis ni Socket.io.
+
+Usage : python test/bench_live_frames.py [nb_devices] [nb_trames]
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.live_codec import decode_frame, dictionary_entry, encode_frame, metadata
+
+TYPES = [("temperature", "°C"), ("humidity", "%"), ("pressure", "hPa"), ("light", "lux"), ("system", "")]
+
+def make_frame(n):
+    """Trame coalescée réaliste : un payload publisher par device"""
+    now = datetime.utcnow().isoformat()
+    frame = []
+    for i in range(n):
+        metric_type, unit = TYPES[i % len(TYPES)]
+        value = {"cpu_percent": 12.5, "ram_percent": 48.1} if metric_type == "system" else 20.0 + i % 10 / 3
+        frame.append({
+            "device_id": f"3f6c2a1e-8d4b-4c7a-9e2f-{i:012d}",
+            "owner_id": str(i % 50),
+            "name": f"Capteur {metric_type} {i}",
+            "type": metric_type,
+            "value": value,
+            "unit": unit,
+            "status": "active",
+            "location": "Bâtiment A - Salle serveur",
+            "timestamp": now,
+        })
+    return frame
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    return (time.perf_counter() - start) / rounds, result
+
+def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    frame = make_frame(devices)
+    index = {p["device_id"]: i for i, p in enumerate(frame, start=1)}
+    dictionary = [dictionary_entry(index[p["device_id"]], metadata(p)) for p in frame]
+
+    # Chemin JSON actuel : sérialisation Socket.io de {"metrics": [...]}
+    json_time, json_bytes = timed(lambda: json.dumps(["metrics_live_batch", {"metrics": frame}]).encode(), rounds)
+    # Chemin compact : résolution des index (cache local) + msgpack
+    compact_time, compact_bytes = timed(lambda: encode_frame([index[p["device_id"]] for p in frame], frame), rounds)
+    dict_bytes = len(json.dumps(["metrics_dict", dictionary]).encode())
+    assert len(decode_frame(compact_bytes)) == devices
+
+    print(f"Trame de {devices} métriques, moyenne sur {rounds} encodages")
+    print(f"  JSON    : {len(json_bytes):9d} octets  {json_time * 1e6:9.1f} µs/trame")
+    print(f"  compact : {len(compact_bytes):9d} octets  {compact_time * 1e6:9.1f} µs/trame "
+          f"(-{100 * (1 - len(compact_bytes) / len(json_bytes)):.0f}% octets, x{json_time / compact_time:.2f} vitesse)")
+    print(f"  dictionnaire (une fois par connexion) : {dict_bytes} octets, "
+          f"amorti après {dict_bytes / max(1, len(json_bytes) - len(compact_bytes)):.1f} trame(s)")
+
+if __name__ == "__main__":
+    main()
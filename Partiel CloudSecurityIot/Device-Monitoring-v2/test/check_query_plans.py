@@ -0,0 +1,84 @@
+"""
+Vérification des plans d'exécution : lance explain() sur chaque forme de requête du DAL (mode
+METRIC_STORAGE_MODE, et rollups si ROLLUP_ENABLED=true) et échoue si une requête parcourt toute la
+collection (COLLSCAN) ou trie en mémoire avant agrégation (SORT bloquant).
+Les index déclarés sont réconciliés à l'instanciation du DAL, comme au démarrage de l'API.
+
+Usage : MONGO_URI=mongodb://localhost:27017 python test/check_query_plans.py
+Code de sortie 1 si au moins une requête n'est pas couverte par un index.
+"""
+import os
+import sys
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import MongoClient
+from dal.metric_rollup_dal import MetricRollupDAL
+from dal.metric_storage import create_metric_dal
+from helpers.config import METRIC_STORAGE_MODE, MONGO_URI, ROLLUP_ENABLED, ROLLUP_RETENTION_DAYS
+
+def _walk(node) -> Tuple[List[str], bool]:
+    """Étapes d'un plan (récursif) et présence d'un GROUP sous le nœud.
+
+    Un SORT au-dessus d'un GROUP trie des buckets agrégés, pas des mesures : il n'est pas signalé.
+    """
+    problems, has_group = [], False
+    if isinstance(node, list):
+        for child in node:
+            child_problems, child_group = _walk(child)
+            problems += child_problems
+            has_group = has_group or child_group
+        return problems, has_group
+    if not isinstance(node, dict):
+        return problems, has_group
+    for key, child in node.items():
+        if isinstance(child, (dict, list)) and key not in ("rejectedPlans", "parsedQuery", "filter", "indexBounds"):
+            child_problems, child_group = _walk(child)
+            problems += child_problems
+            has_group = has_group or child_group
+    stage = node.get("stage")
+    if stage == "GROUP":
+        has_group = True
+    elif stage == "COLLSCAN":
+        problems.append("COLLSCAN")
+    elif stage == "SORT" and not has_group:
+        problems.append("SORT bloquant")
+    return problems, has_group
+
+def _pipeline_problems(explain: dict) -> List[str]:
+    """Étapes d'agrégation non poussées dans le moteur de requête : un $sort avant $group est bloquant"""
+    problems = []
+    for stage in explain.get("stages", []):
+        if "$group" in stage:
+            break
+        if "$sort" in stage:
+            problems.append("$sort bloquant")
+    return problems
+
+def plan_problems(explain: dict) -> List[str]:
+    problems, _ = _walk(explain)
+    return problems + _pipeline_problems(explain)
+
+def main() -> int:
+    db = MongoClient(MONGO_URI)["device_monitoring"]
+    sample = db[create_metric_dal(db, METRIC_STORAGE_MODE).collection.name].find_one() or {}
+    meta = sample.get("meta", sample)
+    device_id = meta.get("device_id", "device-check")
+    owner_id = meta.get("owner_id", 1)
+    metric_type = meta.get("metric_type", "temperature")
+
+    plans = create_metric_dal(db, METRIC_STORAGE_MODE).explain_queries(device_id, owner_id, metric_type)
+    if ROLLUP_ENABLED:
+        plans.update(MetricRollupDAL(db, ROLLUP_RETENTION_DAYS).explain_queries(device_id, owner_id, metric_type))
+
+    failed = 0
+    for name, explain in plans.items():
+        problems = plan_problems(explain)
+        failed += bool(problems)
+        print(f"{'ÉCHEC' if problems else 'OK   '} {name}{' : ' + ', '.join(sorted(set(problems))) if problems else ''}")
+    print(f"\n{len(plans) - failed}/{len(plans)} requêtes couvertes par un index (mode {METRIC_STORAGE_MODE})")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
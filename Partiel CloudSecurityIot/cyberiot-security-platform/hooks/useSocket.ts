@@ -6,15 +6,18 @@ import { MetricPayload, DeviceType } from '../types';
 export const useSocket = () => {
   const [isConnected, setIsConnected] = useState(false);
   const [latestMetric, setLatestMetric] = useState<MetricPayload | null>(null);
+  const [latestByDevice, setLatestByDevice] = useState<Record<string, MetricPayload>>({});
   const socketRef = useRef<Socket | null>(null);
 
   useEffect(() => {
     // Attempt real connection
     try {
+      // Authenticated connection: the server only sends this user's metrics (owner room)
       socketRef.current = io({
         path: '/socket.io',
         transports: ['websocket'],
         timeout: 5000,
+        auth: { token: localStorage.getItem('token') },
       });
 
       socketRef.current.on('connect', () => {
@@ -28,6 +31,18 @@ export const useSocket = () => {
 
       socketRef.current.on('metrics_live', (data: MetricPayload) => {
         setLatestMetric(data);
+        setLatestByDevice((prev) => ({ ...prev, [data.device_id]: data }));
+      });
+
+      // Coalesced frame: newest value per device/metric type
+      socketRef.current.on('metrics_live_batch', (frame: { metrics: MetricPayload[] }) => {
+        if (!frame.metrics.length) return;
+        setLatestMetric(frame.metrics[frame.metrics.length - 1]);
+        setLatestByDevice((prev) => {
+          const next = { ...prev };
+          frame.metrics.forEach((m) => { next[m.device_id] = m; });
+          return next;
+        });
       });
     } catch (e) {
       console.warn('Socket connection failed');
@@ -38,5 +53,5 @@ export const useSocket = () => {
     };
   }, []);
 
-  return { isConnected, latestMetric };
+  return { isConnected, latestMetric, latestByDevice };
 };
@@ -19,7 +19,7 @@ const MOCK_DEVICES: Device[] = [
 const DashboardPage: React.FC = () => {
   const [devices, setDevices] = useState<Device[]>([]);
   const [loading, setLoading] = useState(true);
-  const { isConnected, latestMetric } = useSocket();
+  const { isConnected, latestByDevice } = useSocket();
   const { isDemoMode } = useAuth();
 
   useEffect(() => {
@@ -75,7 +75,7 @@ const DashboardPage: React.FC = () => {
             <LiveChart 
               key={device.device_id} 
               device={device} 
-              latestMetric={latestMetric} 
+              latestMetric={latestByDevice[device.device_id] ?? null} 
             />
           ))}
         </div>